@@ -0,0 +1,283 @@
+#Import required libraries
+import argparse
+import glob
+import multiprocessing
+import os
+import queue
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+import cv2
+from PawsitionPatrol import PawsitionPatrol
+from PawsitionDetectors import DETECTORS
+
+#File extensions picked up when a directory of videos is given
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.mpg', '.mpeg', '.wmv', '.m4v')
+#Seconds between aggregate progress lines
+PROGRESS_PERIOD = 2.0
+#Seconds of video between checkpoints when --resume is given without --checkpoint-seconds
+DEFAULT_CHECKPOINT_SECONDS = 300
+
+#Function to expand directories and glob patterns into a sorted list of video files
+def find_videos(paths):
+    videos = []
+    for path in paths:
+        if os.path.isdir(path):
+            videos.extend(os.path.join(path, name) for name in sorted(os.listdir(path)) if name.lower().endswith(VIDEO_EXTENSIONS))
+        elif glob.has_magic(path):
+            videos.extend(sorted(glob.glob(path)))
+        else:
+            videos.append(path)
+    #Remove duplicates while keeping the order
+    return list(dict.fromkeys(videos))
+
+#Function to create a PawsitionPatrol from a config file, with extra attribute settings such as pipeline=True
+def load_patrol(config_path, root_dir, settings=None):
+    pawsition_patrol = PawsitionPatrol(root_dir)
+    pawsition_patrol.load_config(config_path)
+    for name, value in (settings or {}).items():
+        if not hasattr(pawsition_patrol, name):
+            raise ValueError(f"Unknown PawsitionPatrol setting: {name}")
+        setattr(pawsition_patrol, name, value)
+    return pawsition_patrol
+
+#Function to track a single video end to end without any GUI
+def track_video(video_path, config_path, root_dir, progress_queue=None, settings=None, print_stage_times=False):
+    pawsition_patrol = load_patrol(config_path, root_dir, settings)
+    pawsition_patrol.verbose = False
+    pawsition_patrol.show_video = False
+    pawsition_patrol.open_video(video_path, create_output=False)
+    #Make sure the file is readable before creating its output folder
+    ret, _ = pawsition_patrol.cap.read()
+    if not ret:
+        pawsition_patrol.cap.release()
+        raise IOError(f"No readable frames in video file: {video_path}")
+    pawsition_patrol.open_output()
+    total_frames = int(pawsition_patrol.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    progress = None
+    if progress_queue is not None:
+        progress = lambda frames: progress_queue.put((video_path, frames, total_frames))
+    frames = pawsition_patrol.track(progress=progress)
+    if progress is not None:
+        progress(frames)
+    if print_stage_times:
+        print(f"Stage times for {video_path}:\n{pawsition_patrol.stage_times.report()}")
+        #A resumed video that was already tracked to the end creates no detector
+        if pawsition_patrol.fgbg is not None:
+            print(f"Detector {pawsition_patrol.detector}: {pawsition_patrol.fgbg.cost():.3f} ms/frame")
+    return frames
+
+#Function to detect the hamster in one time segment of a video, run in a worker process
+def detect_chunk(video_path, config_path, start_frame, end_frame, warmup_frames, settings=None):
+    pawsition_patrol = load_patrol(config_path, None, settings)
+    pawsition_patrol.open_video(video_path, create_output=False)
+    detections = list(pawsition_patrol.detect_frames(start_frame, end_frame, warmup_frames))
+    pawsition_patrol.cap.release()
+    return detections
+
+#Function to split frame_count frames into chunks equal time segments
+def split_frames(frame_count, chunks):
+    bounds = [round(i * frame_count / chunks) for i in range(chunks + 1)]
+    #The frame count reported by some containers is approximate, so the last segment reads to the end of the video
+    bounds[-1] = None
+    return [(bounds[i], bounds[i + 1]) for i in range(chunks) if bounds[i + 1] is None or bounds[i + 1] > bounds[i]]
+
+#Function to track one video by tracking time segments in parallel and stitching them into a single _positions.csv
+def track_video_chunked(video_path, config_path, root_dir, chunks, warmup_frames=500, workers=None, settings=None):
+    pawsition_patrol = load_patrol(config_path, root_dir, settings)
+    pawsition_patrol.verbose = False
+    pawsition_patrol.open_video(video_path, create_output=False)
+    frame_count = int(pawsition_patrol.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    pawsition_patrol.cap.release()
+    start_frame = pawsition_patrol.frame_index
+    if frame_count <= start_frame:
+        raise IOError(f"Could not read the frame count of video file: {video_path}")
+    segments = [(start_frame + start, None if end is None else start_frame + end) for start, end in split_frames(frame_count - start_frame, chunks)]
+    with ProcessPoolExecutor(max_workers=min(workers or os.cpu_count() or 1, len(segments)), initializer=init_worker) as pool:
+        futures = [pool.submit(detect_chunk, video_path, config_path, start, end, warmup_frames, settings) for start, end in segments]
+        #The last known zone and position are replayed in order, so they carry across segment boundaries exactly
+        pawsition_patrol.open_output()
+        frames = 0
+        for future in futures:
+            detections = future.result()
+            pawsition_patrol.write_rows(list(pawsition_patrol.stitch_detections(detections)))
+            frames += len(detections)
+    pawsition_patrol.close_output()
+    return frames
+
+#Function run once in each worker process
+def init_worker():
+    #Each process tracks its own video, so keep OpenCV from oversubscribing the cores
+    cv2.setNumThreads(1)
+
+#Class to collect progress messages from the workers and print aggregate progress
+class BatchProgress:
+    def __init__(self, total_videos):
+        self.total_videos = total_videos
+        self.start = time.perf_counter()
+        self.last_print = 0
+        self.video_frames = {}  #Frames tracked so far for each video
+        self.video_totals = {}  #Total frames of each video
+        self.done = 0
+        self.failed = 0
+
+    #Method to record a progress message from a worker
+    def update(self, video_path, frames, total_frames):
+        self.video_frames[video_path] = frames
+        self.video_totals[video_path] = total_frames
+
+    #Method to forget the progress of a failed attempt, so a retry is shown as starting until it reports again
+    def restart(self, video_path):
+        self.video_frames.pop(video_path, None)
+        self.video_totals.pop(video_path, None)
+
+    #Method to print a progress line if enough time has passed
+    def report(self, running, force=False):
+        now = time.perf_counter()
+        if not force and now - self.last_print < PROGRESS_PERIOD:
+            return
+        self.last_print = now
+        elapsed = now - self.start
+        frames = sum(self.video_frames.values())
+        status = [f"[{elapsed:7.1f}s] {self.done}/{self.total_videos} videos done, {self.failed} failed | {frames} frames | {frames / elapsed if elapsed else 0:.1f} frames/sec"]
+        for video_path in running:
+            total = self.video_totals.get(video_path)
+            percent = f"{100 * self.video_frames.get(video_path, 0) / total:.0f}%" if total else "starting"
+            status.append(f"{os.path.basename(video_path)} {percent}")
+        print(" | ".join(status))
+
+#Function to track many videos on a process pool, retrying or skipping files that fail
+def track_videos(videos, config_path, root_dir, workers=None, retries=1, settings=None, print_stage_times=False):
+    workers = workers or os.cpu_count() or 1
+    manager = multiprocessing.Manager()
+    progress_queue = manager.Queue()
+    progress = BatchProgress(len(videos))
+    attempts = {video_path: 0 for video_path in videos}
+    results = {}  #Number of frames tracked, or the error, for each video
+    pending = list(videos)
+    try:
+        #A crashed worker breaks the whole pool, so failed videos are retried on a fresh pool
+        while pending:
+            with ProcessPoolExecutor(max_workers=min(workers, len(pending)), initializer=init_worker) as pool:
+                futures = {pool.submit(track_video, video_path, config_path, root_dir, progress_queue, settings, print_stage_times): video_path for video_path in pending}
+                pending = []
+                while futures:
+                    done, _ = wait(futures, timeout=0.2, return_when=FIRST_COMPLETED)
+                    drain_progress(progress_queue, progress)
+                    for future in done:
+                        video_path = futures.pop(future)
+                        attempts[video_path] += 1
+                        try:
+                            results[video_path] = future.result()
+                            progress.done += 1
+                            continue
+                        except Exception as e:
+                            error = e
+                        progress.restart(video_path)
+                        if attempts[video_path] > retries:
+                            print(f"Failed to track {video_path}: {error}. Skipping.")
+                            results[video_path] = error
+                            progress.failed += 1
+                        elif isinstance(error, BrokenProcessPool):
+                            print(f"Worker crashed while tracking {video_path}. Retrying on a new pool.")
+                            pending.append(video_path)
+                        else:
+                            print(f"Failed to track {video_path} (attempt {attempts[video_path]}): {error}. Retrying.")
+                            futures[pool.submit(track_video, video_path, config_path, root_dir, progress_queue, settings, print_stage_times)] = video_path
+                    progress.report(futures.values())
+        drain_progress(progress_queue, progress)
+        progress.report([], force=True)
+    finally:
+        manager.shutdown()
+    return results
+
+#Function to track videos one after another, each split into time segments tracked in parallel
+def track_videos_chunked(videos, config_path, root_dir, chunks, warmup_frames, workers=None, settings=None):
+    results = {}
+    for i, video_path in enumerate(videos):
+        print(f"[{i + 1}/{len(videos)}] Tracking {video_path} in {chunks} segments")
+        start = time.perf_counter()
+        try:
+            results[video_path] = track_video_chunked(video_path, config_path, root_dir, chunks, warmup_frames, workers, settings)
+        except Exception as e:
+            print(f"Failed to track {video_path}: {e}. Skipping.")
+            results[video_path] = e
+            continue
+        elapsed = time.perf_counter() - start
+        print(f"Tracked {results[video_path]} frames in {elapsed:.1f} s ({results[video_path] / elapsed if elapsed else 0:.1f} frames/sec)")
+    return results
+
+#Function to read every progress message waiting in the queue
+def drain_progress(progress_queue, progress):
+    while True:
+        try:
+            progress.update(*progress_queue.get_nowait())
+        except queue.Empty:
+            return
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Track every video in a directory or glob with a saved zone/sensitivity config, without any GUI.")
+    parser.add_argument('videos', nargs='+', help="Video files, directories or glob patterns (quote globs so the shell does not expand them).")
+    parser.add_argument('-c', '--config', required=True, help="JSON or YAML config file exported by define_zones.")
+    parser.add_argument('-o', '--output', default='./output', help="Root directory for the per-video output folders (default: ./output).")
+    parser.add_argument('-f', '--format', choices=('csv', 'track'), default='csv', help="Write _positions.csv files, or binary _positions.track directories that load much faster (default: csv).")
+    parser.add_argument('-w', '--workers', type=int, default=None, help="Number of worker processes (default: number of CPU cores).")
+    parser.add_argument('--chunks', type=int, default=1, help="Split each video into this many time segments tracked in parallel (default: 1, one worker per video).")
+    parser.add_argument('--warmup-frames', type=int, default=500, help="Frames before each segment used to prime its background model (default: 500, the MOG2 history).")
+    parser.add_argument('--pipeline', action='store_true', help="Decode, detect and write in separate threads connected by bounded queues.")
+    parser.add_argument('--queue-size', type=int, default=64, help="Maximum number of frames or row batches waiting between pipeline stages (default: 64).")
+    parser.add_argument('--detector', choices=DETECTORS, default=None, help="Background model, overriding the config: mog2, knn, median (static background of sampled frames) or diff (frame differencing).")
+    parser.add_argument('--stride', type=int, default=None, help="Process every Nth frame (or at most every Nth with --adaptive); skipped frames still feed the background model.")
+    parser.add_argument('--adaptive', action='store_true', help="Sample every frame while the foreground changes and back off to --stride while the animal is stationary.")
+    parser.add_argument('--grab', action='store_true', help="Skip frames between samples without decoding them, so they do not update the background model.")
+    parser.add_argument('--recorded-start', action='store_true', help="Start each video at the start frame chosen for it in the interactive tracker, if one was recorded.")
+    parser.add_argument('--resume', action='store_true', help=f"Continue each video from its last checkpoint, appending to its positions file; videos tracked to the end are skipped. Saves checkpoints every {DEFAULT_CHECKPOINT_SECONDS:g} s of video unless --checkpoint-seconds is given.")
+    parser.add_argument('--checkpoint-seconds', type=float, default=None, help=f"Seconds of video between checkpoints a stopped run can be resumed from (default: none, or {DEFAULT_CHECKPOINT_SECONDS:g} with --resume).")
+    parser.add_argument('--stage-times', action='store_true', help="Print the time spent decoding, detecting and writing for each video.")
+    parser.add_argument('--retries', type=int, default=1, help="Number of times a failed video is retried before it is skipped (default: 1).")
+    args = parser.parse_args(argv)
+    if args.resume and args.chunks > 1:
+        parser.error("--resume cannot be combined with --chunks, which writes each positions file in one go at the end")
+    return args
+
+#Function to collect the PawsitionPatrol settings given on the command line
+def tracking_settings(args):
+    settings = {'pipeline': args.pipeline, 'queue_size': args.queue_size, 'output_format': args.format}
+    #Sampling options given on the command line override the config file
+    if args.detector is not None:
+        settings['detector'] = args.detector
+    if args.stride is not None:
+        settings['frame_stride'] = args.stride
+    if args.adaptive:
+        settings['adaptive_stride'] = True
+    if args.grab:
+        settings['skip_mode'] = 'grab'
+    if args.recorded_start:
+        settings['start_from_index'] = True
+    if args.resume:
+        settings['resume'] = True
+        settings['checkpoint_seconds'] = DEFAULT_CHECKPOINT_SECONDS
+    if args.checkpoint_seconds is not None:
+        settings['checkpoint_seconds'] = args.checkpoint_seconds
+    return settings
+
+def main(argv=None):
+    args = parse_args(argv)
+    videos = find_videos(args.videos)
+    if not videos:
+        print("No video files found.")
+        return 1
+    settings = tracking_settings(args)
+    print(f"Tracking {len(videos)} videos.")
+    if args.chunks > 1:
+        results = track_videos_chunked(videos, args.config, args.output, args.chunks, args.warmup_frames, workers=args.workers, settings=settings)
+    else:
+        results = track_videos(videos, args.config, args.output, workers=args.workers, retries=args.retries, settings=settings, print_stage_times=args.stage_times)
+    failed = [video_path for video_path, result in results.items() if isinstance(result, Exception)]
+    print(f"Finished: {len(videos) - len(failed)} tracked, {len(failed)} failed.")
+    for video_path in failed:
+        print(f"  failed: {video_path} ({results[video_path]})")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,118 @@
+import hashlib
+import json
+import os
+import shutil
+import pandas as pd
+
+# Bump when an analysis changes its results, so entries written by older code are not reused
+ANALYSIS_VERSION = 2
+DEFAULT_CACHE_DIR = os.environ.get('PAWSITION_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'PawsitionPatrol'))
+DEFAULT_CACHE_MB = 512
+
+def file_fingerprint(file_path, use_hash=True):
+    # A track is a directory, so it is fingerprinted from every file in it
+    if os.path.isdir(file_path):
+        files = [os.path.join(file_path, name) for name in sorted(os.listdir(file_path))]
+    else:
+        files = [file_path]
+    digest = hashlib.sha256()
+    for name in files:
+        digest.update(os.path.basename(name).encode())
+        if use_hash:
+            with open(name, 'rb') as f:
+                for block in iter(lambda: f.read(1024 ** 2), b''):
+                    digest.update(block)
+        else:
+            stat = os.stat(name)
+            digest.update(f"{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return digest.hexdigest()
+
+def outputs_current(file_path, output_paths):
+    # Outputs are current when they all exist and none is older than the input
+    input_time = os.path.getmtime(file_path)
+    return all(os.path.exists(path) and os.path.getmtime(path) >= input_time for path in output_paths)
+
+class CacheEntry:
+    # Each result is stored in its own file and only read the first time it is used
+    def __init__(self, path, compute=None):
+        self.path = path
+        self.compute = compute  # Function returning all the results, used if the entry is evicted before a result is read
+        self.loaded = {}
+
+    def __contains__(self, name):
+        return name in self.loaded or os.path.exists(self.item_path(name))
+
+    def __getitem__(self, name):
+        if name not in self.loaded:
+            try:
+                self.loaded[name] = pd.read_pickle(self.item_path(name))
+            except FileNotFoundError:
+                # Eviction, here or by another process sharing the cache, makes this a cache miss
+                if self.compute is None:
+                    raise KeyError(name) from None
+                self.loaded.update(self.compute())
+        return self.loaded[name]
+
+    def item_path(self, name):
+        return os.path.join(self.path, name + '.pkl')
+
+class ResultCache:
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_mb=DEFAULT_CACHE_MB, use_hash=True):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_mb * 1024 ** 2
+        # Hashing reads every input file; with use_hash=False inputs are keyed by size and modification time
+        self.use_hash = use_hash
+
+    def key(self, file_path, kind, params=None):
+        digest = hashlib.sha256(file_fingerprint(file_path, self.use_hash).encode())
+        digest.update(json.dumps({'kind': kind, 'version': ANALYSIS_VERSION, **(params or {})}, sort_keys=True).encode())
+        return digest.hexdigest()
+
+    def get(self, key, compute=None):
+        path = os.path.join(self.cache_dir, key)
+        try:
+            # Touch the entry so eviction drops the least recently used entries first
+            os.utime(path)
+        except OSError:
+            return None
+        return CacheEntry(path, compute) if os.path.isdir(path) else None
+
+    def put(self, key, results):
+        path = os.path.join(self.cache_dir, key)
+        # Write into a temporary directory and rename it, so an interrupted write never leaves half an entry
+        partial = f"{path}.{os.getpid()}.tmp"
+        os.makedirs(partial, exist_ok=True)
+        entry = CacheEntry(partial)
+        for name, value in results.items():
+            pd.to_pickle(value, entry.item_path(name))
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(partial, path)
+        self.evict(keep=key)
+        # The results are returned as given, so they stay usable even if the entry is evicted later
+        return results
+
+    def evict(self, keep=None):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if os.path.isdir(path) and not name.endswith('.tmp'):
+                size = sum(entry.stat().st_size for entry in os.scandir(path))
+                entries.append((os.path.getmtime(path), size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            # The entry just written is kept even if it alone is over the limit
+            if name == keep:
+                continue
+            shutil.rmtree(os.path.join(self.cache_dir, name), ignore_errors=True)
+            total -= size
+
+def add_cache_arguments(parser):
+    parser.add_argument('--no-cache', action='store_true', help="Recompute every session instead of reusing cached results.")
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help=f"Directory of cached results (default: {DEFAULT_CACHE_DIR}, or $PAWSITION_CACHE).")
+    parser.add_argument('--cache-mb', type=float, default=DEFAULT_CACHE_MB, help=f"Least recently used results are evicted above this size (default: {DEFAULT_CACHE_MB}).")
+    parser.add_argument('--mtime-keys', action='store_true', help="Key cached results by file size and modification time instead of a content hash.")
+
+def cache_from_args(args):
+    return None if args.no_cache else ResultCache(args.cache_dir, args.cache_mb, not args.mtime_keys)
@@ -0,0 +1,121 @@
+import argparse
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from PawsitionPatrolData import extract_subject
+from PawsitionTrack import is_track, track_dir, load_track, ROW_DTYPES
+from PawsitionCache import add_cache_arguments, cache_from_args
+
+POSITION_FILE_PATTERNS = ('*_positions.csv', '*_positions.track')
+
+def find_sessions(paths):
+    sessions = []
+    for path in paths:
+        if os.path.isdir(path) and not is_track(path):
+            # Search the directory tree for the tracker's position files
+            for pattern in POSITION_FILE_PATTERNS:
+                sessions.extend(glob.glob(os.path.join(path, '**', pattern), recursive=True))
+        elif glob.has_magic(path):
+            sessions.extend(glob.glob(path))
+        else:
+            sessions.append(path)
+    return sorted(dict.fromkeys(track_dir(session) if is_track(session) else session for session in sessions))
+
+def load_session(file_path):
+    data = load_track(file_path) if is_track(file_path) else pd.read_csv(file_path, dtype=ROW_DTYPES)
+    data = data.dropna(subset=['Position X', 'Position Y'])
+    # Sessions are keyed by their file, as files of the same subject from different folders or days have the same name
+    data.insert(0, 'Session', file_path)
+    data.insert(0, 'Subject', extract_subject(file_path))
+    return data
+
+def load_cohort(file_paths, workers=1):
+    if workers > 1 and len(file_paths) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            sessions = list(pool.map(load_session, file_paths))
+    else:
+        sessions = [load_session(file_path) for file_path in file_paths]
+    cohort = pd.concat(sessions, ignore_index=True)
+    cohort['Subject'] = cohort['Subject'].astype('category')
+    cohort['Session'] = cohort['Session'].astype('category')
+    # Keep each session in time order so differences within a session are between consecutive samples
+    return cohort.sort_values(['Session', 'Time'], kind='stable', ignore_index=True)
+
+def analyze_cohort(cohort, outlier_std=3):
+    by_session = cohort.groupby('Session', observed=True, sort=False)
+
+    # Each row's zone holds until the session's next row, as in PawsitionPatrol.analyze_data
+    cohort = cohort.assign(**{'Time Difference': by_session['Time'].shift(-1) - cohort['Time']})
+    zone_times = cohort.groupby(['Session', 'Zone'], observed=True)['Time Difference'].sum().rename('Total Time')
+
+    # A zone is entered wherever it differs from the session's previous row
+    entries = cohort.loc[cohort['Zone'].ne(by_session['Zone'].shift()), ['Session', 'Time', 'Zone']]
+    entry_groups = entries.groupby(['Session', 'Zone'], observed=True)['Time']
+    zone_entries = entry_groups.size().rename('Entries')
+    first_entry = entry_groups.min().rename('First Entry')
+
+    # Step distances within each session, dropping steps above median + outlier_std * std as in calculate_distances
+    distance = np.hypot(by_session['Position X'].diff(), by_session['Position Y'].diff()).fillna(0)
+    by_session_distance = distance.groupby(cohort['Session'], observed=True)
+    threshold = by_session_distance.transform('median') + outlier_std * by_session_distance.transform('std')
+    outlier = distance > threshold
+    session_distance = pd.DataFrame({
+        'Distance Traveled': distance.where(~outlier, 0).groupby(cohort['Session'], observed=True).sum(),
+        'Outliers': outlier.groupby(cohort['Session'], observed=True).sum(),
+    })
+
+    summary = pd.concat([zone_times, zone_entries, first_entry], axis=1).reset_index()
+    summary = summary.merge(session_distance, left_on='Session', right_index=True, how='left')
+    summary['Total Time'] = summary['Total Time'].round(3)
+    summary['Session'] = summary['Session'].astype(str)
+    summary.insert(0, 'Subject', summary['Session'].map(extract_subject))
+    return summary.sort_values(['Subject', 'Session', 'Zone'], ignore_index=True)
+
+def summarize_cohort(file_paths, outlier_std=3, workers=1, cache=None):
+    # Summaries of unchanged sessions come from the cache, so only new or changed sessions are loaded and analyzed
+    summaries, new_sessions, keys = [], [], {}
+    for file_path in file_paths:
+        entry = None
+        if cache is not None:
+            keys[file_path] = cache.key(file_path, 'cohort', {'outlier_std': outlier_std})
+            entry = cache.get(keys[file_path])
+        if entry is not None:
+            try:
+                # Keys hash the file's contents, so the entry may have been stored under another path to the same data
+                summaries.append(entry['summary'].assign(Subject=extract_subject(file_path), Session=file_path))
+                continue
+            except KeyError:
+                # Evicted by another process sharing the cache since it was looked up
+                pass
+        new_sessions.append(file_path)
+    if new_sessions:
+        print(f"Analyzing {len(new_sessions)} new or changed sessions, reusing {len(summaries)} cached.")
+        summary = analyze_cohort(load_cohort(new_sessions, workers), outlier_std)
+        if cache is not None:
+            for file_path in new_sessions:
+                cache.put(keys[file_path], {'summary': summary[summary['Session'] == file_path]})
+        summaries.append(summary)
+    return pd.concat(summaries, ignore_index=True).sort_values(['Subject', 'Session', 'Zone'], ignore_index=True)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarize zone times, entries, first entry times and distance for a whole cohort in one table.")
+    parser.add_argument('paths', nargs='+', help="Position files, track directories, globs, or directories searched for *_positions.csv/.track files.")
+    parser.add_argument('-o', '--output', default='Cohort_Summary.csv', help="Summary table to write (default: Cohort_Summary.csv).")
+    parser.add_argument('-w', '--workers', type=int, default=1, help="Processes used to load the sessions (default: 1).")
+    parser.add_argument('--outlier-std', type=float, default=3, help="Steps longer than median + this many standard deviations are outliers (default: 3).")
+    add_cache_arguments(parser)
+    args = parser.parse_args(argv)
+    file_paths = find_sessions(args.paths)
+    if not file_paths:
+        print("No position files found.")
+        return 1
+    print(f"Found {len(file_paths)} sessions.")
+    summary = summarize_cohort(file_paths, args.outlier_std, args.workers, cache_from_args(args))
+    summary.to_csv(args.output, index=False)
+    print(f"Cohort summary for {summary['Session'].nunique()} sessions of {summary['Subject'].nunique()} subjects saved to {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
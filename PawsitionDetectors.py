@@ -0,0 +1,95 @@
+#Import required libraries
+import time
+import cv2
+import numpy as np
+
+#Every detector turns a detection frame into a foreground mask where the foreground is above 200, as MOG2 marks it
+#(MOG2 and KNN mark shadows with 127, which the tracker's threshold drops). Each detector times its own calls.
+
+#Class with the shared timing of all detectors
+class Detector:
+    def __init__(self):
+        self.seconds = 0.0  #Time spent in apply
+        self.frames = 0  #Number of frames passed to apply
+
+    #Method to update the model with a frame and return its foreground mask
+    def apply(self, frame):
+        start = time.perf_counter()
+        fgmask = self.subtract(frame)
+        self.seconds += time.perf_counter() - start
+        self.frames += 1
+        return fgmask
+
+    #Method to get the average time per frame in milliseconds
+    def cost(self):
+        return 1000 * self.seconds / self.frames if self.frames else 0.0
+
+#Function to convert a frame to grayscale for the difference based detectors
+def gray(frame):
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+
+#Class for OpenCV's adaptive Gaussian mixture background model
+class MOG2Detector(Detector):
+    def __init__(self, history=500, detect_shadows=True):
+        super().__init__()
+        self.model = cv2.createBackgroundSubtractorMOG2(history=history, detectShadows=detect_shadows)
+
+    def subtract(self, frame):
+        return self.model.apply(frame)
+
+#Class for OpenCV's k-nearest-neighbours background model
+class KNNDetector(Detector):
+    def __init__(self, history=500, detect_shadows=True):
+        super().__init__()
+        self.model = cv2.createBackgroundSubtractorKNN(history=history, detectShadows=detect_shadows)
+
+    def subtract(self, frame):
+        return self.model.apply(frame)
+
+#Class for a static background, the per-pixel median of frames sampled across the video, for fixed cameras
+class MedianDetector(Detector):
+    def __init__(self, samples, threshold=25):
+        super().__init__()
+        self.samples = samples  #Function returning the sampled detection frames, called on the first frame
+        self.threshold = threshold  #Difference from the background that makes a pixel foreground
+        self.background = None
+
+    def subtract(self, frame):
+        frame = gray(frame)
+        if self.background is None:
+            samples = [gray(sample) for sample in self.samples()]
+            self.background = np.median(np.stack(samples), axis=0).astype(np.uint8) if samples else frame.copy()
+        diff = cv2.absdiff(frame, self.background)
+        cv2.threshold(diff, self.threshold, 255, cv2.THRESH_BINARY, dst=diff)
+        return diff
+
+#Class for the difference between consecutive frames, which only sees the animal while it moves
+class FrameDifferenceDetector(Detector):
+    def __init__(self, threshold=25):
+        super().__init__()
+        self.threshold = threshold
+        self.previous = None
+
+    def subtract(self, frame):
+        frame = gray(frame)
+        previous, self.previous = self.previous, frame
+        if previous is None or previous.shape != frame.shape:
+            return np.zeros_like(frame)
+        diff = cv2.absdiff(frame, previous)
+        cv2.threshold(diff, self.threshold, 255, cv2.THRESH_BINARY, dst=diff)
+        return diff
+
+#Names of the detectors that can be chosen with the detector setting
+DETECTORS = ('mog2', 'knn', 'median', 'diff')
+
+#Function to create a detector by name; samples is only used by the median detector
+def create_detector(name, history=500, detect_shadows=True, diff_threshold=25, samples=None):
+    if name == 'mog2':
+        return MOG2Detector(history, detect_shadows)
+    if name == 'knn':
+        return KNNDetector(history, detect_shadows)
+    if name == 'median':
+        return MedianDetector(samples or list, diff_threshold)
+    if name == 'diff':
+        return FrameDifferenceDetector(diff_threshold)
+    raise ValueError(f"Unknown detector: {name}")
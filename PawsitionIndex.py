@@ -0,0 +1,136 @@
+#Import required libraries
+import json
+import os
+import cv2
+import numpy as np
+
+#An index holds a small JPEG thumbnail of every Nth frame, decoded in one sequential pass so every thumbnail is
+#the right frame, and the frame numbers of the keyframes, where a seek lands exactly without decoding earlier frames.
+#It is saved next to the video and rebuilt when the video changes.
+INDEX_SUFFIX = '_index.npz'
+INDEX_VERSION = 1
+THUMBNAIL_WIDTH = 480
+THUMBNAIL_QUALITY = 80
+
+#Function to get the path of the index saved next to a video
+def index_path(video_path):
+    return os.path.splitext(video_path)[0] + INDEX_SUFFIX
+
+#Function to identify the version of a video an index was built from
+def video_signature(video_path):
+    stat = os.stat(video_path)
+    return {'video_size': stat.st_size, 'video_mtime': stat.st_mtime_ns}
+
+#Function to list the keyframes of a video by reading its packets without decoding them, or None if the backend cannot tell
+def scan_keyframes(video_path):
+    if not hasattr(cv2, 'CAP_PROP_LRF_HAS_KEY_FRAME'):
+        return None
+    cap = cv2.VideoCapture(video_path, cv2.CAP_FFMPEG, [cv2.CAP_PROP_FORMAT, -1])
+    if not cap.isOpened():
+        return None
+    keyframes = []
+    frame_num = 0
+    while cap.grab():
+        if cap.get(cv2.CAP_PROP_LRF_HAS_KEY_FRAME):
+            keyframes.append(frame_num)
+        frame_num += 1
+    cap.release()
+    #Without a keyframe at frame 0 the packets were not read as expected
+    return keyframes if keyframes and keyframes[0] == 0 else None
+
+#Class to look up thumbnails and keyframes of a video
+class FrameIndex:
+    def __init__(self, video_path, period, frames, offsets, data, keyframes, frame_count, start_frame=0, signature=None):
+        self.video_path = video_path
+        self.period = period  #Number of frames between thumbnails
+        self.frames = frames  #Frame number of each thumbnail
+        self.offsets = offsets  #End of each thumbnail's JPEG bytes in data
+        self.data = data  #JPEG bytes of every thumbnail, one after the other
+        self.keyframes = keyframes  #Sorted keyframe numbers, or None if they are unknown
+        self.frame_count = frame_count  #Number of frames decoded when the index was built
+        self.start_frame = start_frame  #Frame chosen to start the analysis at
+        self.signature = signature or video_signature(video_path)
+
+    #Method to build an index in one pass over the video, reporting the fraction done to progress
+    @classmethod
+    def build(cls, video_path, period, width=THUMBNAIL_WIDTH, progress=None):
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            raise IOError(f"Could not open video file: {video_path}")
+        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        frames, thumbnails = [], []
+        frame_num = 0
+        #Grab every frame in order and only convert and encode the thumbnail frames
+        while cap.grab():
+            if frame_num % period == 0:
+                ret, frame = cap.retrieve()
+                if ret:
+                    scale = min(1.0, width / frame.shape[1])
+                    thumbnail = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+                    thumbnails.append(cv2.imencode('.jpg', thumbnail, [cv2.IMWRITE_JPEG_QUALITY, THUMBNAIL_QUALITY])[1].tobytes())
+                    frames.append(frame_num)
+                if progress is not None and total:
+                    progress(frame_num / total)
+            frame_num += 1
+        cap.release()
+        offsets = np.cumsum([len(thumbnail) for thumbnail in thumbnails], dtype=np.int64)
+        data = np.frombuffer(b''.join(thumbnails), dtype=np.uint8)
+        return cls(video_path, period, np.array(frames, dtype=np.int64), offsets, data, scan_keyframes(video_path), frame_num)
+
+    #Method to load the index saved next to a video, or None if there is none or the video has changed since
+    @classmethod
+    def load(cls, video_path):
+        path = index_path(video_path)
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as index:
+            header = json.loads(str(index['header']))
+            if header.get('version') != INDEX_VERSION or header.get('signature') != video_signature(video_path):
+                return None
+            keyframes = index['keyframes'] if header['has_keyframes'] else None
+            return cls(video_path, header['period'], index['frames'], index['offsets'], index['data'], keyframes,
+                       header['frame_count'], header['start_frame'], header['signature'])
+
+    #Method to save the index next to the video
+    def save(self):
+        header = {'version': INDEX_VERSION, 'period': self.period, 'frame_count': self.frame_count, 'start_frame': self.start_frame,
+                  'has_keyframes': self.keyframes is not None, 'signature': self.signature}
+        keyframes = np.asarray(self.keyframes if self.keyframes is not None else [], dtype=np.int64)
+        np.savez(index_path(self.video_path), header=json.dumps(header), frames=self.frames, offsets=self.offsets, data=self.data, keyframes=keyframes)
+
+    #Method to get the last thumbnail at or before a frame, with its frame number
+    def thumbnail(self, frame_num):
+        i = max(0, int(np.searchsorted(self.frames, frame_num, side='right')) - 1)
+        start = self.offsets[i - 1] if i else 0
+        return int(self.frames[i]), cv2.imdecode(self.data[start:self.offsets[i]], cv2.IMREAD_COLOR)
+
+    #Method to get the last keyframe at or before a frame, or None if the keyframes are unknown
+    def keyframe_before(self, frame_num):
+        if self.keyframes is None or not len(self.keyframes):
+            return None
+        return int(self.keyframes[max(0, int(np.searchsorted(self.keyframes, frame_num, side='right')) - 1)])
+
+    #Method to position a VideoCapture so its next read returns frame_num, seeking only to a keyframe and grabbing forward from it
+    def seek(self, cap, frame_num):
+        keyframe = self.keyframe_before(frame_num)
+        if keyframe is None:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, frame_num)
+            return
+        cap.set(cv2.CAP_PROP_POS_FRAMES, keyframe)
+        for _ in range(frame_num - keyframe):
+            if not cap.grab():
+                break
+
+#Function to load the index of a video, building and saving it if it is missing or stale
+def open_index(video_path, period, width=THUMBNAIL_WIDTH, rebuild=False):
+    saved = FrameIndex.load(video_path)
+    index = None if rebuild else saved
+    if index is None or index.period != period:
+        print(f"Indexing {os.path.basename(video_path)} for scrubbing...")
+        index = FrameIndex.build(video_path, period, width, progress=lambda done: print(f"\r{100 * done:.0f}%", end='', flush=True))
+        print()
+        #The start frame belongs to the unchanged video, not to the thumbnails, so a rebuilt index keeps it
+        if saved is not None:
+            index.start_frame = saved.start_frame
+        index.save()
+    return index
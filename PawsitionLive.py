@@ -0,0 +1,224 @@
+#Import required libraries
+import argparse
+import os
+import threading
+import time
+from collections import deque
+import cv2
+import numpy as np
+import pandas as pd
+from PawsitionPatrol import PawsitionPatrol
+from PawsitionPipeline import StageTimer, BatchWriter
+from PawsitionStream import ZoneTimeAccumulator
+
+#Frame rate assumed for cameras that do not report one
+DEFAULT_FPS = 30.0
+#Seconds between flushes of the positions and the live zone times to disk
+FLUSH_SECONDS = 1.0
+#Maximum number of overlay frames shown per second; frames in between are tracked but not drawn
+DISPLAY_FPS = 15
+#Suffix of the zone times file rewritten at every flush, in the format of the _Zone_Times.csv analysis file
+LIVE_ZONE_TIMES_SUFFIX = '_Live_Zone_Times.csv'
+
+#Function to turn a camera index given as text into a number, so '0' opens the first camera rather than a file called 0
+def parse_source(source):
+    return int(source) if str(source).isdigit() else source
+
+#Class to read a camera, stream or file in a background thread, keeping only the newest frame so tracking never falls behind
+class LatestFrameCapture:
+    def __init__(self, source, realtime=True):
+        self.source = source
+        self.cap = cv2.VideoCapture(source)
+        if not self.cap.isOpened():
+            raise IOError(f"Could not open video source: {source}")
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or DEFAULT_FPS
+        #Files are read as fast as they decode unless they are played at their own frame rate, as a camera would deliver them
+        self.realtime = realtime and isinstance(source, str) and os.path.isfile(source)
+        self.condition = threading.Condition()
+        self.stopping = threading.Event()
+        self.frame = None  #Newest frame read
+        self.frame_num = -1  #Number of the newest frame read
+        self.timestamp = None  #Seconds from the start of the capture to when the newest frame was read
+        self.taken = -1  #Number of the last frame handed to the tracker
+        self.captured = 0  #Number of frames read
+        self.dropped = 0  #Number of frames replaced by a newer one before the tracker took them
+        self.ended = False
+        self.error = None
+        self.start = None
+        self.thread = None
+
+    #Method to start reading frames in the background
+    def begin(self):
+        self.start = time.monotonic()
+        self.thread = threading.Thread(target=self.capture, name="capture", daemon=True)
+        self.thread.start()
+
+    #Method run by the capture thread
+    def capture(self):
+        try:
+            while not self.stopping.is_set():
+                if self.realtime:
+                    delay = self.start + self.captured / self.fps - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                ret, frame = self.cap.read()
+                if not ret:
+                    break
+                timestamp = time.monotonic() - self.start
+                with self.condition:
+                    #An unread frame is stale once a newer one arrives, so it is dropped rather than queued
+                    if self.frame_num > self.taken:
+                        self.dropped += 1
+                    self.frame, self.frame_num, self.timestamp = frame, self.captured, timestamp
+                    self.captured += 1
+                    self.condition.notify()
+        except Exception as e:
+            self.error = e
+        finally:
+            with self.condition:
+                self.ended = True
+                self.condition.notify_all()
+
+    #Method to wait for a frame newer than the last one taken, returning its number, timestamp and image, or None at the end of the source
+    def read(self):
+        with self.condition:
+            #Wake up regularly so Ctrl+C is not held up by a camera that stopped sending frames
+            while self.frame_num <= self.taken and not self.ended:
+                self.condition.wait(0.5)
+            if self.frame_num > self.taken:
+                self.taken = self.frame_num
+                return self.frame_num, self.timestamp, self.frame
+        if self.error is not None:
+            raise self.error
+        return None
+
+    #Method to stop the capture thread and release the source
+    def close(self):
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.cap.release()
+
+#Function to get the seconds per zone of an accumulator as a _Zone_Times.csv table
+def zone_times_table(accumulator):
+    seconds_per_zone = accumulator.seconds_per_zone()
+    return pd.DataFrame({'Zone': seconds_per_zone.index, 'Total Time': seconds_per_zone.values.round(3)})
+
+#Function to replace a subject's live zone times file, writing a temporary file first so readers never see half a table
+def write_live_zone_times(tracker, accumulator):
+    path = os.path.join(tracker.root_dir, tracker.base_file_name, tracker.base_file_name + LIVE_ZONE_TIMES_SUFFIX)
+    zone_times_table(accumulator).to_csv(path + '.tmp', index=False)
+    os.replace(path + '.tmp', path)
+
+#Function to format the zone times of every subject on one line
+def occupancy_line(trackers, accumulators):
+    subjects = []
+    for tracker, accumulator in zip(trackers, accumulators):
+        table = zone_times_table(accumulator)
+        zones = ", ".join(f"zone {int(zone)} {seconds:.1f} s" for zone, seconds in zip(table['Zone'], table['Total Time']))
+        subjects.append(f"{tracker.base_file_name}: {zones or 'no zone yet'}")
+    return " | ".join(subjects)
+
+#Function to track a camera, stream or file as it is captured, keeping the zone times up to date and on disk
+def track_live(pawsition_patrol, source, name, realtime=True, duration=None, flush_seconds=FLUSH_SECONDS, display_fps=DISPLAY_FPS):
+    if pawsition_patrol.detector == 'median':
+        raise ValueError("The median detector needs frames from the whole video, which a live source does not have. Use mog2, knn or diff.")
+    capture = LatestFrameCapture(parse_source(source), realtime)
+    pawsition_patrol.open_capture(capture.cap, str(source), name, capture.fps)
+    trackers = pawsition_patrol.arena_trackers or [pawsition_patrol]
+    #Each subject's zone times are accumulated as rows arrive, the same way the analysis adds them up from the positions file
+    accumulators = [ZoneTimeAccumulator() for _ in trackers]
+    pending = [[] for _ in trackers]
+    pawsition_patrol.stage_times = StageTimer()
+    #Rows are only written in batches between flushes, so the tracker never waits on the disk for single rows
+    writer = BatchWriter(pawsition_patrol.write_rows, pawsition_patrol.stage_times, batch_size=max(1, int(flush_seconds * capture.fps)))
+    #Latency from capture to the finished row, over the whole session and over the last 100 frames
+    latency_total, latency_max, recent_latencies = 0.0, 0.0, deque(maxlen=100)
+    processed = 0
+    next_flush = flush_seconds
+    next_display = 0.0
+    capture.begin()
+    try:
+        while True:
+            frame = capture.read()
+            if frame is None:
+                break
+            frame_num, timestamp, image = frame
+            if duration is not None and timestamp >= duration:
+                break
+            start = time.perf_counter()
+            row, bbox, thresh = pawsition_patrol.process_frame(image, frame_num, current_time=timestamp)
+            pawsition_patrol.stage_times.add('detect', time.perf_counter() - start)
+            writer.write(row)
+            processed += 1
+            for rows, subject_row in zip(pending, row if pawsition_patrol.arena_trackers else [row]):
+                #Rows without a position are left out of the zone times, as in data_clean
+                if subject_row[1] is not None:
+                    rows.append((subject_row[0], subject_row[3]))
+            now = time.monotonic() - capture.start
+            latency = now - timestamp
+            latency_total, latency_max = latency_total + latency, max(latency_max, latency)
+            recent_latencies.append(latency)
+            if now >= next_flush:
+                writer.flush()
+                pawsition_patrol.flush_output()
+                for tracker, accumulator, rows in zip(trackers, accumulators, pending):
+                    if rows:
+                        times, zones = zip(*rows)
+                        accumulator.update(times, zones)
+                        rows.clear()
+                    write_live_zone_times(tracker, accumulator)
+                print(f"[{timestamp:7.1f}s] {occupancy_line(trackers, accumulators)} | latency {1000 * np.mean(recent_latencies):.0f} ms | dropped {capture.dropped}/{capture.captured}")
+                next_flush = now + flush_seconds
+            #The overlay is only drawn a few times a second; frames keep arriving in the capture thread while it is shown
+            if pawsition_patrol.show_video and now >= next_display:
+                pawsition_patrol.draw_overlay(pawsition_patrol.transform_frame(image), row, bbox, thresh)
+                next_display = now + 1 / display_fps
+                if cv2.waitKey(1) & 0xFF == ord('q'):
+                    break
+    finally:
+        capture.close()
+        writer.close()
+        for accumulator, rows in zip(accumulators, pending):
+            if rows:
+                times, zones = zip(*rows)
+                accumulator.update(times, zones)
+        for tracker, accumulator in zip(trackers, accumulators):
+            if tracker.writer is not None or tracker.csv_file is not None:
+                write_live_zone_times(tracker, accumulator)
+        pawsition_patrol.close_output()
+        if pawsition_patrol.show_video:
+            cv2.destroyAllWindows()
+    return {'captured': capture.captured, 'processed': processed, 'dropped': capture.dropped,
+            'mean_latency_ms': 1000 * latency_total / processed if processed else None, 'max_latency_ms': 1000 * latency_max if processed else None,
+            'zone_times': {tracker.base_file_name: zone_times_table(accumulator) for tracker, accumulator in zip(trackers, accumulators)}}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Track a camera, stream URL or video file live, with zone times updated as frames arrive.")
+    parser.add_argument('source', help="Camera index (0 for the first camera), stream URL such as rtsp://..., or a video file, which is played at its own frame rate.")
+    parser.add_argument('-c', '--config', required=True, help="JSON or YAML config file with the zones and settings, exported by define_zones.")
+    parser.add_argument('-o', '--output', default='./output', help="Root directory for the output folder (default: ./output).")
+    parser.add_argument('-n', '--name', default=None, help="Name of the session's output files (default: live_<date>_<time>).")
+    parser.add_argument('-f', '--format', choices=('csv', 'track'), default='csv', help="Write a _positions.csv file or a binary _positions.track directory (default: csv).")
+    parser.add_argument('--show', action='store_true', help="Show the detections and zones while tracking; press 'q' to stop.")
+    parser.add_argument('--duration', type=float, default=None, help="Stop after this many seconds (default: until the source ends or 'q' or Ctrl+C is pressed).")
+    parser.add_argument('--flush-seconds', type=float, default=FLUSH_SECONDS, help=f"Seconds between writes of the positions and live zone times to disk (default: {FLUSH_SECONDS}).")
+    parser.add_argument('--as-fast', action='store_true', help="Read a video file as fast as it decodes instead of at its own frame rate.")
+    args = parser.parse_args(argv)
+    pawsition_patrol = PawsitionPatrol(args.output)
+    pawsition_patrol.load_config(args.config)
+    pawsition_patrol.output_format = args.format
+    pawsition_patrol.show_video = args.show
+    pawsition_patrol.verbose = False
+    name = args.name or time.strftime('live_%Y%m%d_%H%M%S')
+    try:
+        stats = track_live(pawsition_patrol, args.source, name, realtime=not args.as_fast, duration=args.duration, flush_seconds=args.flush_seconds)
+    except KeyboardInterrupt:
+        print("Stopped. The positions and zone times up to now are saved.")
+        return 0
+    print(f"Tracked {stats['processed']} of {stats['captured']} frames, {stats['dropped']} stale frames dropped, "
+          f"latency {stats['mean_latency_ms'] or 0:.0f} ms mean, {stats['max_latency_ms'] or 0:.0f} ms max.")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,147 @@
+import numpy as np
+import pandas as pd
+
+# Default settings of the trajectory metrics; times are in seconds and distances in pixels
+DEFAULT_METRICS_PARAMS = {
+    'speed_window': 1.0,  # Seconds of rows the smoothed speed of each row is measured over, centered on the row
+    'immobile_speed': 10.0,  # Smoothed speed in pixels per second below which the animal is immobile
+    'min_bout': 2.0,  # Shortest immobile stretch in seconds that counts as an immobility bout
+    'tortuosity_window': 10.0,  # Seconds of path in each window tortuosity is measured over
+}
+# Windows where the animal ends up closer than this many pixels to where it started have no meaningful tortuosity
+MIN_DISPLACEMENT = 1.0
+METRICS_COLUMNS = ['Subject', 'Zone', 'Total Time', 'Visits', 'Mean Dwell', 'Max Dwell', 'First Entry', 'Distance Traveled',
+                   'Mean Speed', 'Max Speed', 'Immobile Time', 'Immobility Bouts', 'Mean Bout', 'Tortuosity']
+
+def run_lengths(values):
+    # Start index, length and value of every run of equal consecutive values; rows without a zone (NaN) never equal each other,
+    # so like the zone changes in PawsitionPatrol.analyze_data each of them is a run of its own
+    values = np.asarray(values)
+    if not len(values):
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp), values
+    change = np.empty(len(values), dtype=bool)
+    change[0] = True
+    np.not_equal(values[1:], values[:-1], out=change[1:])
+    starts = np.flatnonzero(change)
+    return starts, np.diff(np.append(starts, len(values))), values[starts]
+
+def run_durations(time, starts, lengths):
+    # Each row holds until the next row, so a run lasts from its first row to the row after it, or to the last row
+    ends = np.minimum(starts + lengths, len(time) - 1)
+    return time[ends] - time[starts]
+
+def step_distances(x, y, outlier_std=3):
+    # Steps between consecutive rows, with the outliers of calculate_distances (above median + outlier_std * std) counted as 0;
+    # computed in place, as temporary arrays of millions of rows cost more than the arithmetic
+    distance, dy = np.zeros(len(x)), np.zeros(len(y))
+    np.subtract(x[1:], x[:-1], out=distance[1:])
+    np.subtract(y[1:], y[:-1], out=dy[1:])
+    distance *= distance
+    dy *= dy
+    distance += dy
+    np.sqrt(distance, out=distance)
+    if len(distance) < 2:
+        return distance
+    threshold = np.median(distance) + outlier_std * np.std(distance, ddof=1)
+    distance[distance > threshold] = 0
+    return distance
+
+def smoothed_speed(time, distance, window):
+    # Rolling window of about window seconds of rows centered on each row, sized from the mean time between rows; the path
+    # covered in it is divided by the time it actually spans, so gaps from frames without a detection slow it down correctly
+    half = max(1, int(round(window / 2 * (len(time) - 1) / (time[-1] - time[0])))) if len(time) > 1 and time[-1] > time[0] else 1
+    # Repeating the first and last values half times makes the windows at the ends stop at the ends, with plain slices
+    cumulative = np.pad(np.cumsum(distance), half, mode='edge')
+    time = np.pad(time, half, mode='edge')
+    span = time[2 * half:] - time[:-2 * half]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        speed = np.subtract(cumulative[2 * half:], cumulative[:-2 * half]) / span
+    speed[span <= 0] = np.nan
+    return speed
+
+def zone_codes(zones, zone_ids):
+    # Position of each row's zone in the sorted zone_ids; rows without a zone get len(zone_ids), as NaN sorts last
+    return np.searchsorted(zone_ids, zones)
+
+def zone_sums(codes, weights, zone_count):
+    # Sum of the weights of each zone, in one pass over the rows
+    return np.bincount(codes, weights, minlength=zone_count + 1)[:zone_count]
+
+def session_metrics(data_clean, seconds_per_zone, zone_latency, subject, outlier_std=3, params=None):
+    # One row for the whole session ('All') and one per zone, computed with whole-array operations over the rows
+    params = {**DEFAULT_METRICS_PARAMS, **(params or {})}
+    data = data_clean.sort_values('Time', kind='stable') if not data_clean['Time'].is_monotonic_increasing else data_clean
+    time = data['Time'].to_numpy(dtype=np.float64)
+    x = data['Position X'].to_numpy(dtype=np.float64)
+    y = data['Position Y'].to_numpy(dtype=np.float64)
+    zones = data['Zone'].to_numpy(dtype=np.float64)
+    zone_ids = seconds_per_zone.index.to_numpy(dtype=np.float64)
+    if not len(time):
+        return pd.DataFrame(columns=METRICS_COLUMNS)
+    codes = zone_codes(zones, zone_ids)
+    held_time = np.diff(time, append=time[-1])
+    distance = step_distances(x, y, outlier_std)
+    speed = smoothed_speed(time, distance, params['speed_window'])
+
+    # Dwell episodes: the runs of rows in the same zone, which start at the rows of entry_exit_times
+    starts, lengths, episode_zones = run_lengths(zones)
+    episodes = pd.DataFrame({'Zone': episode_zones, 'Dwell': run_durations(time, starts, lengths)}).dropna(subset=['Zone'])
+    dwell = episodes.groupby('Zone')['Dwell'].agg(['size', 'mean', 'max']).reindex(zone_ids)
+
+    # Immobility bouts: runs of rows slower than immobile_speed lasting at least min_bout, in the zone they start in
+    starts, lengths, immobile = run_lengths(speed < params['immobile_speed'])
+    durations = run_durations(time, starts, lengths)
+    bout = immobile & (durations >= params['min_bout'])
+    in_bout = np.repeat(bout, lengths)
+    bouts = pd.DataFrame({'Zone': zones[starts[bout]], 'Duration': durations[bout]})
+    zone_bouts = bouts.groupby('Zone')['Duration'].agg(['size', 'mean']).reindex(zone_ids)
+
+    # Tortuosity: path length over the straight-line distance between the ends of consecutive windows, in the zone each starts in
+    window_starts, _, _ = run_lengths(np.floor((time - time[0]) / params['tortuosity_window']))
+    window_ends = np.append(window_starts[1:], len(time) - 1)
+    cumulative = np.cumsum(distance)
+    displacement = np.hypot(x[window_ends] - x[window_starts], y[window_ends] - y[window_starts])
+    usable = displacement >= MIN_DISPLACEMENT
+    windows = pd.DataFrame({'Zone': zones[window_starts[usable]],
+                            'Tortuosity': (cumulative[window_ends] - cumulative[window_starts])[usable] / displacement[usable]})
+
+    zone_time = seconds_per_zone.to_numpy(dtype=np.float64)
+    # Each step is taken while the zone of the row it starts from holds
+    zone_distance = zone_sums(codes[:-1], distance[1:], len(zone_ids))
+    first_entry = zone_latency.groupby('Entering Zone')['Zone Change Time'].min().reindex(zone_ids)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        per_zone = pd.DataFrame({
+            'Zone': zone_ids,
+            'Total Time': zone_time,
+            'Visits': dwell['size'].fillna(0).to_numpy(),
+            'Mean Dwell': dwell['mean'].to_numpy(),
+            'Max Dwell': dwell['max'].to_numpy(),
+            'First Entry': first_entry.to_numpy(),
+            'Distance Traveled': zone_distance,
+            'Mean Speed': np.where(zone_time > 0, zone_distance / zone_time, np.nan),
+            'Max Speed': pd.Series(speed).groupby(codes).max().reindex(range(len(zone_ids))).to_numpy(),
+            'Immobile Time': zone_sums(codes, held_time * in_bout, len(zone_ids)),
+            'Immobility Bouts': zone_bouts['size'].fillna(0).to_numpy(),
+            'Mean Bout': zone_bouts['mean'].to_numpy(),
+            'Tortuosity': windows.groupby('Zone')['Tortuosity'].median().reindex(zone_ids).to_numpy(),
+        })
+    duration = time[-1] - time[0]
+    session = pd.DataFrame([{
+        'Zone': 'All',
+        'Total Time': duration,
+        'Visits': len(episodes),
+        'Mean Dwell': episodes['Dwell'].mean(),
+        'Max Dwell': episodes['Dwell'].max(),
+        'First Entry': zone_latency.loc[zone_latency['Entering Zone'].notna(), 'Zone Change Time'].min(),
+        'Distance Traveled': distance.sum(),
+        'Mean Speed': distance.sum() / duration if duration > 0 else np.nan,
+        'Max Speed': np.nanmax(speed) if np.isfinite(speed).any() else np.nan,
+        'Immobile Time': (held_time * in_bout).sum(),
+        'Immobility Bouts': len(bouts),
+        'Mean Bout': bouts['Duration'].mean(),
+        'Tortuosity': windows['Tortuosity'].median(),
+    }])
+    metrics = pd.concat([session, per_zone.astype({'Zone': object})], ignore_index=True)
+    metrics = metrics.astype({'Visits': int, 'Immobility Bouts': int})
+    metrics.insert(0, 'Subject', subject)
+    return metrics[METRICS_COLUMNS]
@@ -3,8 +3,20 @@ import cv2
 import os
 import numpy as np
 import csv
+import json
+import time
 import tkinter as tk
 from tkinter import filedialog
+try:
+    import yaml
+except ImportError:
+    yaml = None
+from PawsitionPipeline import StageTimer, BatchWriter, prefetch, timed
+from Rotate import rotation_matrix
+from PawsitionTrack import TrackWriter, TRACK_EXTENSION, track_rows, truncate_track
+from PawsitionZones import ZoneIndex, normalize_zone, zone_to_config, zone_from_points, zone_bounds, draw_zone, normalize_arena, arena_to_config
+from PawsitionIndex import FrameIndex, open_index, video_signature
+from PawsitionDetectors import create_detector
 
 #Create PawsitionPatrol class
 class PawsitionPatrol:
@@ -12,19 +24,65 @@ class PawsitionPatrol:
         #Initialize instance variables
         self.root_dir = root_dir
         self.zones = []  #List to store defined zones
+        self.zone_shapes = []  #Shape of each zone while the zones are being drawn
+        self.zone_shape = 'rect'  #Shape drawn by the mouse in define_zones: 'rect', 'ellipse' or 'polygon'
+        self.polygon_open = False  #Boolean to determine if clicks add corners to the last polygon zone
+        self.zone_index = None  #Lookup raster compiled from the zones on the first frame
         self.rat_positions = []  #List to store positions of the detected hamster
         self.last_known_zone = None  #Store the last known zone of the hamster
         self.sensitivity = 500  #Sensitivity for hamster detection
         self.show_video = False  #Boolean to determine if the video playback should be shown
         self.video_path = None  #Path to the video file
         self.cap = None  #VideoCapture object
+        self.frame_width = None  #Width of the video frames, recorded when the video is opened
+        self.frame_height = None  #Height of the video frames, recorded when the video is opened
         self.base_file_name = None  #Base name of the video file
-        self.fgbg = cv2.createBackgroundSubtractorMOG2()  #Background subtractor object
+        self.fgbg = None  #Background model, created from the detector settings on the first frame
+        self.detector = 'mog2'  #Background model: 'mog2', 'knn', 'median' (static background of sampled frames) or 'diff' (frame differencing)
+        self.detector_history = 500  #Number of frames the mog2 and knn models adapt over
+        self.detect_shadows = True  #Boolean to determine if mog2 and knn mark shadows, which the threshold then drops
+        self.diff_threshold = 25  #Gray level difference that makes a pixel foreground for the median and diff detectors
+        self.background_samples = 25  #Number of frames sampled across the video for the median background
         self.fps = None  #Frames per second of the video
         self.csv_file = None  #CSV file to save the hamster's positions and corresponding times
-        self.writer = None  #CSV writer
+        self.writer = None  #CSV writer, or TrackWriter for the binary track format
+        self.output_format = 'csv'  #'csv' for a _positions.csv file, 'track' for a binary _positions.track directory
         self.frame_index = 0  #Index of the current frame
         self.frame_jump = 0  #Number of frames to jump for next or previous second of the video
+        self.seek_index = None  #Thumbnail and keyframe index of the video, used to scrub and to seek exactly
+        self.start_from_index = False  #Boolean to determine if tracking starts at the start frame recorded in the video's index
+        self.verbose = True  #Boolean to determine if every tracked frame should be printed
+        self.pipeline = False  #Boolean to determine if decoding, detection and writing run in separate threads
+        self.queue_size = 64  #Maximum number of frames or row batches waiting between pipeline stages
+        self.write_batch_size = 256  #Number of rows written to the CSV file at once
+        self.stage_times = StageTimer()  #Time spent decoding, detecting and writing
+        self.roi = None  #Region (x, y, width, height) of the frame to run detection on, None for the whole frame
+        self.crop_to_zones = False  #Boolean to determine if detection only runs on the union of the defined zones
+        self.grayscale = False  #Boolean to determine if detection runs on a grayscale frame
+        self.detection_scale = 1.0  #Factor to downscale the frame by before detection
+        self.rotation = 0.0  #Angle in degrees to rotate the video by, like Rotate.py, without re-encoding it
+        self.crop = None  #Region (x, y, width, height) of the rotated frame to keep; positions are relative to it
+        self.detection_window = None  #Region of the frame detection runs on, computed from the first frame
+        self.output_transform = None  #Affine map from video pixels to rotated and cropped output pixels
+        self.output_size = None  #Size (width, height) of the rotated and cropped output frame
+        self.detection_mask = None  #Mask of the detection frame pixels that fall inside the cropped output frame
+        self.frame_stride = 1  #Process every Nth frame, or at most every Nth frame when adaptive_stride is true
+        self.skip_mode = 'feed'  #'feed' decodes skipped frames for the background model, 'grab' skips them without decoding
+        self.adaptive_stride = False  #Boolean to determine if frames are sampled densely only while the foreground changes
+        self.adaptive_threshold = 0.25  #Relative change of the foreground area that switches adaptive sampling to every frame
+        self.current_stride = 1  #Stride used for the next sample
+        self.last_foreground_area = 0  #Foreground area of the last processed frame
+        self.blob_method = 'contours'  #'contours' to pick the largest contour, 'components' to use connectedComponentsWithStats
+        self.morph_kernel = 0  #Size of the morphological opening applied to the mask, 0 for none
+        self.morph_element = None  #Structuring element for the morphological opening
+        self.thresh_buffer = None  #Thresholded mask reused across frames
+        self.labels_buffer = None  #Component labels reused across frames
+        self.arenas = []  #Arenas filmed in the same frame, each with a name, an roi and its own zones; empty to track a single animal
+        self.arena_trackers = []  #PawsitionPatrol of each arena, holding its zones, last known zone and output
+        self.arena_window = None  #Region of the shared detection frame covering this tracker's arena
+        self.checkpoint_seconds = 0  #Seconds of video between checkpoints a stopped run can be resumed from, 0 for none
+        self.resume = False  #Boolean to determine if tracking continues from the last checkpoint instead of starting over
+        self.checkpoint = None  #Checkpoint tracking resumes from, loaded when the output is opened
 
     #Method to select video file
     def select_video_file(self):
@@ -32,62 +90,292 @@ class PawsitionPatrol:
         root = tk.Tk()
         root.withdraw()
         print("Please select a video file.")
-        self.video_path = filedialog.askopenfilename()
+        self.open_video(filedialog.askopenfilename())
+
+    #Method to open a video file and create its output files without any dialog
+    def open_video(self, video_path, create_output=True):
         #Initialize the VideoCapture object and other related instance variables
-        self.cap = cv2.VideoCapture(self.video_path)
-        self.base_file_name = os.path.splitext(os.path.basename(self.video_path))[0]
-        self.fps = self.cap.get(cv2.CAP_PROP_FPS)
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            raise IOError(f"Could not open video file: {video_path}")
+        #An index saved by an earlier session gives exact seeks; it is only built when scrubbing needs it
+        self.seek_index = FrameIndex.load(video_path)
+        if self.start_from_index and self.seek_index is not None:
+            self.frame_index = self.seek_index.start_frame
+        self.open_capture(cap, video_path, os.path.splitext(os.path.basename(video_path))[0], cap.get(cv2.CAP_PROP_FPS), create_output)
+
+    #Method to track the frames of an opened VideoCapture, such as a live camera, with output files named after name
+    def open_capture(self, cap, source, name, fps, create_output=True):
+        self.video_path = source
+        self.cap = cap
+        #Recorded now, as the capture may be released before the output header is written
+        self.frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.base_file_name = name
+        self.fps = fps
         self.frame_jump = int(1 * self.fps)
-        #Create a directory to save the output and initialize the CSV file and writer
+        self.arena_trackers = [self.arena_tracker(arena) for arena in self.arenas]
+        self.reset_detection_geometry()
+        if create_output:
+            self.open_output()
+
+    #Method to create a tracker for one arena, sharing this tracker's video and settings
+    def arena_tracker(self, arena):
+        tracker = PawsitionPatrol(self.root_dir)
+        for name in CONFIG_SETTINGS:
+            setattr(tracker, name, getattr(self, name))
+        tracker.roi = arena['roi']
+        tracker.zones = arena['zones']
+        tracker.output_format = self.output_format
+        tracker.video_path = self.video_path
+        tracker.cap = self.cap
+        tracker.frame_width = self.frame_width
+        tracker.frame_height = self.frame_height
+        tracker.fps = self.fps
+        #Each arena is its own subject, with its own output folder and positions file
+        tracker.base_file_name = f"{self.base_file_name}_{arena['name']}"
+        return tracker
+
+    #Method to create the output directory and initialize the CSV file and writer, or reopen them after the last checkpoint when resuming
+    def open_output(self):
+        self.checkpoint = self.load_checkpoint() if self.resume else None
+        if self.checkpoint is not None:
+            #The output keeps the start frame of the interrupted run, and tracking continues from the checkpoint
+            self.frame_index = self.checkpoint['start_frame']
+        elif os.path.exists(self.checkpoint_path()):
+            #The output is written from the start, so a checkpoint of an earlier run no longer describes it
+            os.remove(self.checkpoint_path())
+        trackers = self.arena_trackers or [self]
+        states = self.checkpoint['subjects'] if self.checkpoint is not None else [None] * len(trackers)
+        for tracker, state in zip(trackers, states):
+            tracker.frame_index = self.frame_index
+            tracker.open_positions_file(state)
+        if self.checkpoint is not None:
+            self.frame_index = self.checkpoint['next_frame']
+            self.last_foreground_area = self.checkpoint['last_foreground_area']
+
+    #Method to open this tracker's positions file, continuing after the rows saved in a checkpoint's state
+    def open_positions_file(self, state=None):
         directory = os.path.join(self.root_dir, self.base_file_name)
         os.makedirs(directory, exist_ok=True)
+        if state is not None:
+            self.last_known_zone = state['last_known_zone']
+            self.rat_positions = [tuple(state['last_position'])] if state['last_position'] is not None else []
+        if self.output_format == 'track':
+            track_path = os.path.join(directory, self.base_file_name + "_positions" + TRACK_EXTENSION)
+            #Rows written after the checkpoint are tracked again, so they are cut off first
+            if state is not None:
+                truncate_track(track_path, state['output_offset'])
+            self.writer = TrackWriter(track_path, self.track_metadata(), append=state is not None)
+            return
+        if self.output_format != 'csv':
+            raise ValueError(f"Unknown output_format: {self.output_format}")
         csv_file_name = os.path.join(directory, self.base_file_name + "_positions.csv")
+        if state is not None:
+            if os.path.getsize(csv_file_name) < state['output_offset']:
+                raise IOError(f"{csv_file_name} is shorter than its checkpoint")
+            os.truncate(csv_file_name, state['output_offset'])
+            self.csv_file = open(csv_file_name, 'a', newline='')
+            self.writer = csv.writer(self.csv_file)
+            return
         self.csv_file = open(csv_file_name, 'w', newline='')
         self.writer = csv.writer(self.csv_file)
         self.writer.writerow(["Time", "Position X", "Position Y", "Zone"])
 
+    #Method to collect the video metadata stored in the header of a binary track
+    def track_metadata(self):
+        #Cameras and stream URLs are recorded as given
+        video = os.path.abspath(self.video_path) if os.path.exists(str(self.video_path)) else str(self.video_path)
+        metadata = {'video': video, 'fps': self.fps,
+                    'frame_width': self.frame_width, 'frame_height': self.frame_height,
+                    'start_frame': self.frame_index, 'zones': [zone_to_config(zone) for zone in self.zones]}
+        for name in CONFIG_SETTINGS:
+            value = getattr(self, name)
+            metadata[name] = list(value) if isinstance(value, tuple) else value
+        return metadata
+
+    #Method to push the rows written so far to disk, so the output can be read while tracking continues, and with sync survives a crash
+    def flush_output(self, sync=False):
+        for arena in self.arena_trackers:
+            arena.flush_output(sync)
+        if self.csv_file is not None:
+            self.csv_file.flush()
+            if sync:
+                os.fsync(self.csv_file.fileno())
+        elif self.writer is not None:
+            self.writer.flush(sync)
+
+    #Method to get the path of the checkpoint saved next to the positions file
+    def checkpoint_path(self):
+        return os.path.join(self.root_dir, self.base_file_name, self.base_file_name + CHECKPOINT_SUFFIX)
+
+    #Method to get the position to resume writing at: the size of the CSV file, or the number of rows of the track
+    def output_offset(self):
+        if self.csv_file is not None:
+            return self.csv_file.tell()
+        return track_rows(self.writer.track_path)
+
+    #Method to collect the state a resumed run needs to continue this tracker's positions file exactly
+    def subject_state(self):
+        return {'last_known_zone': self.last_known_zone, 'last_position': list(self.rat_positions[-1]) if self.rat_positions else None,
+                'output_offset': self.output_offset()}
+
+    #Method to save a checkpoint once every row up to next_frame has been written to the output
+    def save_checkpoint(self, next_frame, start_frame, finished=False):
+        self.flush_output(sync=True)
+        #The background model cannot be saved, so a resumed run rebuilds it from the frames before the checkpoint
+        checkpoint = {'version': CHECKPOINT_VERSION, 'video': video_signature(self.video_path), 'output_format': self.output_format,
+                      'config': self.config_dict(), 'start_frame': start_frame, 'next_frame': next_frame,
+                      'warmup_start': max(start_frame, next_frame - self.detector_history), 'last_foreground_area': self.last_foreground_area,
+                      'current_stride': self.current_stride, 'finished': finished, 'subjects': [tracker.subject_state() for tracker in self.arena_trackers or [self]]}
+        path = self.checkpoint_path()
+        #With arenas the video itself has no output folder, only its checkpoint
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        #Write to a temporary file first so a crash while saving leaves the previous checkpoint intact
+        with open(path + '.tmp', 'w') as f:
+            json.dump(checkpoint, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + '.tmp', path)
+
+    #Method to load the checkpoint of the video, or None if it has none
+    def load_checkpoint(self):
+        path = self.checkpoint_path()
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            checkpoint = json.load(f)
+        if checkpoint.get('version') != CHECKPOINT_VERSION or checkpoint['video'] != video_signature(self.video_path):
+            raise ValueError(f"{path} was saved for a different version of {self.video_path}. Delete it to track the video from the start.")
+        if checkpoint['output_format'] != self.output_format or checkpoint['config'] != json.loads(json.dumps(self.config_dict())):
+            raise ValueError(f"{path} was saved with different zones, settings or output format. Delete it to track the video from the start.")
+        return checkpoint
+
+    #Method to close the CSV file or track
+    def close_output(self):
+        for arena in self.arena_trackers:
+            arena.close_output()
+        if self.csv_file is not None:
+            self.csv_file.close()
+            self.csv_file = None
+        elif self.writer is not None:
+            self.writer.close()
+        self.writer = None
+
+    #Method to collect the zones and settings saved to config files
+    def config_dict(self):
+        config = {'zones': [zone_to_config(zone) for zone in self.zones]}
+        if self.arenas:
+            config['arenas'] = [arena_to_config(arena) for arena in self.arenas]
+        for name in CONFIG_SETTINGS:
+            value = getattr(self, name)
+            config[name] = list(value) if isinstance(value, tuple) else value
+        return config
+
+    #Method to save the defined zones and settings to a JSON or YAML config file
+    def save_config(self, config_path):
+        config = self.config_dict()
+        if is_yaml_file(config_path):
+            require_yaml()
+        with open(config_path, 'w') as f:
+            if is_yaml_file(config_path):
+                yaml.safe_dump(config, f, default_flow_style=None, sort_keys=False)
+            else:
+                json.dump(config, f, indent=2)
+        print(f"Config saved to {config_path}")
+
+    #Method to load zones and settings from a JSON or YAML config file
+    def load_config(self, config_path):
+        with open(config_path) as f:
+            if is_yaml_file(config_path):
+                require_yaml()
+                config = yaml.safe_load(f) or {}
+            else:
+                config = json.load(f)
+        self.zones = [normalize_zone(zone) for zone in config.get('zones', [])]
+        self.zone_index = None
+        self.arenas = [normalize_arena(arena, i + 1) for i, arena in enumerate(config.get('arenas') or [])]
+        for name in CONFIG_SETTINGS:
+            if config.get(name) is not None:
+                setattr(self, name, config_value(config[name], getattr(self, name)))
+        self.reset_detection_geometry()
+        return config
+
     #Method to handle mouse clicks
     def on_mouse_click(self, event, x, y, flags, param):
-        #If left button down, start a new zone
+        #If left button down, start a new zone, or add a corner to the polygon being drawn
         if event == cv2.EVENT_LBUTTONDOWN:
-            self.zones.append([(x, y)])
-        #If left button up, finalize the current zone
-        elif event == cv2.EVENT_LBUTTONUP:
+            if self.zone_shape == 'polygon' and self.polygon_open:
+                self.zones[-1].append((x, y))
+                self.update_frame_copy()
+            else:
+                self.zones.append([(x, y)])
+                self.zone_shapes.append(self.zone_shape)
+                self.polygon_open = self.zone_shape == 'polygon'
+        #If left button up, finalize the current rectangle or ellipse zone
+        elif event == cv2.EVENT_LBUTTONUP and self.zones and self.zone_shapes[-1] != 'polygon':
             self.zones[-1].append((x, y))
             self.update_frame_copy()
         #If right button down and there are defined zones, remove the last zone
         elif event == cv2.EVENT_RBUTTONDOWN and self.zones:
             self.zones.pop()
+            self.zone_shapes.pop()
+            self.polygon_open = False
             self.update_frame_copy()
 
     #Method to update the frame with drawn zones
     def update_frame_copy(self):
         #Copy the current frame and draw the defined zones
         frame_copy = self.frame.copy()
-        for zone in self.zones:
-            cv2.rectangle(frame_copy, zone[0], zone[1], (255, 0, 0), 2)
+        for points, shape in zip(self.zones, self.zone_shapes):
+            zone = zone_from_points(points, shape)
+            if zone is not None:
+                draw_zone(frame_copy, zone, (255, 0, 0), 2)
+            elif len(points) > 1:
+                cv2.polylines(frame_copy, [np.array(points, dtype=np.int32)], False, (255, 0, 0), 2)
         cv2.imshow('Image', frame_copy)
 
-    #Method to define zones
-    def define_zones(self):
+    #Method to define zones, optionally exporting them to a config file
+    def define_zones(self, config_path=None):
         #Instructions for defining zones
         print("\\nInstructions:")
         print("1. Left click and drag to draw a zone.")
         print("2. Release the left click to finalize the zone.")
         print("3. Right click to remove the most recently added zone.")
-        print("4. Press any key to proceed after you have finished defining zones.\\n")
+        print("4. Press 'r' to draw rectangles, 'e' to draw ellipses, or 'o' to draw polygons.")
+        print("   For polygons, left click each corner and press 'c' to close the polygon.")
+        print("5. Press any other key to proceed after you have finished defining zones.\\n")
         print("Please define zones by clicking and dragging in the image.")
-        #Set the frame position to 1 minute and display the frame for defining zones
-        self.cap.set(cv2.CAP_PROP_POS_MSEC, 60000)
-        ret, self.frame = self.cap.read()
+        #Set the frame position to 1 minute, or the last frame of shorter videos, and display the frame for defining zones
+        self.open_seek_index()
+        self.seek(min(int(60 * self.fps), self.seek_index.frame_count - 1))
+        ret, frame = self.cap.read()
+        #Zones are drawn on the rotated and cropped frame, the same view positions are reported in
+        self.frame = self.transform_frame(frame)
+        self.zone_shapes = []
+        self.polygon_open = False
         cv2.namedWindow('Image')
         cv2.setMouseCallback('Image', self.on_mouse_click, param=self.frame)
         cv2.imshow('Image', self.frame)
-        cv2.waitKey(0)
+        while True:
+            key = cv2.waitKey(0) & 0xFF
+            if key in ZONE_SHAPE_KEYS:
+                self.zone_shape = ZONE_SHAPE_KEYS[key]
+                self.polygon_open = False
+                print(f"Drawing {self.zone_shape} zones.")
+            elif key == ord('c'):
+                self.polygon_open = False
+            else:
+                break
         cv2.destroyAllWindows()
-        #Reset the frame position and finalize the defined zones
-        self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-        self.zones = [cv2.boundingRect(np.array(zone)) for zone in self.zones]
+        #Reset the frame position and finalize the defined zones, dropping any that were not finished
+        self.seek(0)
+        zones = [zone_from_points(points, shape) for points, shape in zip(self.zones, self.zone_shapes)]
+        self.zones = [zone for zone in zones if zone is not None]
+        self.zone_index = None
+        self.reset_detection_geometry()
+        if config_path:
+            self.save_config(config_path)
 
     #Method to set sensitivity
     def set_sensitivity(self):
@@ -104,112 +392,624 @@ class PawsitionPatrol:
         #Get the input from the user if they want to show the video playback
         self.show_video = input("Do you want to show video playback? (y/n): ").lower() == 'y'
 
-    #Method to start the analysis
-    def run(self):
+    #Method to set the rotation angle
+    def set_rotation(self):
+        #Get the angle from the user and validate the input
+        rotation = input("Please enter the angle to rotate the video by, as in Rotate.py (default is 0): ")
+        if rotation:
+            try:
+                self.rotation = float(rotation)
+                self.reset_detection_geometry()
+            except ValueError:
+                print("Invalid input. The video will not be rotated.")
+
+    #Method to offer exporting the zones and sensitivity for headless batch runs
+    def export_config(self):
+        config_path = input("Enter a .json or .yaml path to save the zones and sensitivity for batch runs (leave blank to skip): ").strip()
+        if config_path:
+            self.save_config(config_path)
+
+    #Method to load or build the thumbnail and keyframe index of the video
+    def open_seek_index(self):
+        if self.seek_index is None or self.seek_index.period != self.frame_jump:
+            self.seek_index = open_index(self.video_path, self.frame_jump)
+
+    #Method to position the video so the next read returns frame_num, exactly when the keyframes are indexed
+    def seek(self, frame_num):
+        if self.seek_index is not None:
+            self.seek_index.seek(self.cap, frame_num)
+        else:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_num)
+
+    #Method to choose the frame where the analysis starts
+    def choose_start_frame(self):
+        #Scrub through the index thumbnails instead of seeking and decoding the video on every key press
+        self.open_seek_index()
+        size = (self.frame_width, self.frame_height)
+        last_frame = self.seek_index.frame_count - 1
+        self.frame_index = self.frame_index or self.seek_index.start_frame
         #Instructions for navigating the video
-        print("Press 'n' for next 1 second, 'p' for previous 1 second, 's' to start analysis.")
+        print("Press 'n'/'p' for next/previous 1 second, 'f'/'b' for 10 seconds, 'F'/'B' for 1 minute, 's' to start analysis.")
         #Loop until 's' is pressed
         while True:
-            self.cap.set(cv2.CAP_PROP_POS_FRAMES, self.frame_index)
-            ret, frame = self.cap.read()
-            if not ret:
-                print("Video ended before starting analysis. Please try again.")
-                exit(1)
-            cv2.imshow('Frame', frame)
+            self.frame_index, thumbnail = self.seek_index.thumbnail(self.frame_index)
+            #Thumbnails are scaled down, so scale them back up for the rotation and crop
+            cv2.imshow('Frame', self.transform_frame(cv2.resize(thumbnail, size)))
             key = cv2.waitKey(0)
             if key == ord('s'):
                 break
-            elif key == ord('n'):
-                self.frame_index += self.frame_jump
-            elif key == ord('p'):
-                self.frame_index = max(0, self.frame_index - self.frame_jump)
+            elif key in START_FRAME_KEYS:
+                self.frame_index = min(max(0, self.frame_index + START_FRAME_KEYS[key] * self.frame_jump), last_frame)
             else:
-                print("Invalid key. Press 'n' for next 1 second, 'p' for previous 1 second, 's' start analysis.")
+                print("Invalid key. Press 'n'/'p' for 1 second, 'f'/'b' for 10 seconds, 'F'/'B' for 1 minute, 's' to start analysis.")
         cv2.destroyAllWindows()
+        #Record the start frame in the index so later sessions and batch runs can start there
+        self.seek_index.start_frame = self.frame_index
+        self.seek_index.save()
 
-        #Loop until the end of the video
-        while True:
-            #Get the current frame number and time
-            frame_num = self.cap.get(cv2.CAP_PROP_POS_FRAMES)
+    #Method to forget the detection region and transform so they are recomputed on the next frame
+    def reset_detection_geometry(self):
+        self.detection_window = None
+        self.output_transform = None
+        self.output_size = None
+        self.detection_mask = None
+        self.arena_window = None
+        for arena in self.arena_trackers:
+            arena.reset_detection_geometry()
+
+    #Method to compute the affine map from video pixels to rotated and cropped output pixels, or None without rotation or crop
+    def compile_transform(self, frame_shape):
+        frame_h, frame_w = frame_shape[:2]
+        self.output_size = (frame_w, frame_h)
+        if not self.rotation and self.crop is None:
+            self.output_transform = None
+            return
+        #Rotation to an enlarged canvas exactly like Rotate.rotate_image, followed by the crop offset
+        transform, self.output_size = rotation_matrix(frame_w, frame_h, self.rotation)
+        if self.crop is not None:
+            transform[0, 2] -= self.crop[0]
+            transform[1, 2] -= self.crop[1]
+            self.output_size = tuple(self.crop[2:])
+        self.output_transform = transform
+
+    #Method to map points from video pixels to output pixels
+    def to_output_points(self, points):
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        if self.output_transform is None:
+            return points
+        return points @ self.output_transform[:, :2].T + self.output_transform[:, 2]
+
+    #Method to map points from output pixels back to video pixels
+    def to_video_points(self, points):
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        if self.output_transform is None:
+            return points
+        inverse = cv2.invertAffineTransform(self.output_transform)
+        return points @ inverse[:, :2].T + inverse[:, 2]
+
+    #Method to rotate and crop a frame for display; detection itself never warps the frame
+    def transform_frame(self, frame):
+        if self.detection_window is None:
+            self.detection_window = self.compute_detection_window(frame.shape)
+        if self.output_transform is None:
+            return frame
+        return cv2.warpAffine(frame, self.output_transform, self.output_size, borderMode=cv2.BORDER_CONSTANT, borderValue=(0, 0, 0))
+
+    #Method to compute the region of the video frame detection runs on, from the ROI, the union of the zones or the crop
+    def compute_detection_window(self, frame_shape):
+        self.compile_transform(frame_shape)
+        frame_h, frame_w = frame_shape[:2]
+        #The ROI, the arenas and the zones are given in output pixels
+        if self.roi is not None:
+            x, y, w, h = self.roi
+        elif self.arenas or (self.crop_to_zones and self.zones):
+            #With arenas, detection runs once on the union of their regions
+            bounds = [arena['roi'] for arena in self.arenas] or [zone_bounds(zone) for zone in self.zones]
+            x = min(zone[0] for zone in bounds)
+            y = min(zone[1] for zone in bounds)
+            w = max(zone[0] + zone[2] for zone in bounds) - x
+            h = max(zone[1] + zone[3] for zone in bounds) - y
+        elif self.output_transform is not None:
+            x, y, (w, h) = 0, 0, self.output_size
+        else:
+            return (0, 0, frame_w, frame_h)
+        #Map the region's corners back to video pixels and take their bounding box
+        corners = self.to_video_points([(x, y), (x + w, y), (x + w, y + h), (x, y + h)])
+        x, y = np.floor(corners.min(axis=0)).astype(int)
+        x_end, y_end = np.ceil(corners.max(axis=0)).astype(int)
+        w, h = x_end - x, y_end - y
+        #Clip the region to the frame
+        x0, y0 = max(0, x), max(0, y)
+        x1, y1 = min(frame_w, x + w), min(frame_h, y + h)
+        if x1 <= x0 or y1 <= y0:
+            raise ValueError(f"Detection region {(x, y, w, h)} is outside the {frame_w}x{frame_h} frame")
+        return (int(x0), int(y0), int(x1 - x0), int(y1 - y0))
+
+    #Method to mask out the parts of the detection frame that are outside the rotated and cropped output frame
+    def build_detection_mask(self, shape):
+        out_w, out_h = self.output_size
+        corners = self.to_video_points([(0, 0), (out_w, 0), (out_w, out_h), (0, out_h)])
+        corners = (corners - self.detection_window[:2]) * self.detection_scale
+        mask = np.zeros(shape, dtype=np.uint8)
+        cv2.fillPoly(mask, [np.round(corners).astype(np.int32)], 255)
+        return mask
+
+    #Method to crop, convert and downscale a frame for detection
+    def prepare_detection_frame(self, frame):
+        if self.detection_window is None:
+            self.detection_window = self.compute_detection_window(frame.shape)
+        x, y, w, h = self.detection_window
+        if (w, h) != (frame.shape[1], frame.shape[0]):
+            frame = frame[y:y + h, x:x + w]
+        if self.grayscale and frame.ndim == 3:
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        if self.detection_scale != 1.0:
+            frame = cv2.resize(frame, None, fx=self.detection_scale, fy=self.detection_scale, interpolation=cv2.INTER_AREA)
+        return frame
+
+    #Method to map a bounding box found on the detection frame back to the original pixel coordinates
+    def to_frame_coordinates(self, bbox):
+        if self.detection_window[:2] == (0, 0) and self.detection_scale == 1.0:
+            return bbox
+        x, y, w, h = bbox
+        offset_x, offset_y = self.detection_window[:2]
+        scale = self.detection_scale
+        return (x / scale + offset_x, y / scale + offset_y, w / scale, h / scale)
+
+    #Method to get the background model, creating it from the detector settings the first time
+    def background_model(self):
+        if self.fgbg is None:
+            self.fgbg = create_detector(self.detector, self.detector_history, self.detect_shadows, self.diff_threshold, self.sample_background_frames)
+        return self.fgbg
+
+    #Method to read detection frames evenly spaced across the video for a static background, without moving the main capture
+    def sample_background_frames(self):
+        cap = cv2.VideoCapture(self.video_path)
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        frames = []
+        for frame_num in np.linspace(0, max(frame_count - 1, 0), self.background_samples).astype(int):
+            if self.seek_index is not None:
+                self.seek_index.seek(cap, frame_num)
+            else:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, frame_num)
+            ret, frame = cap.read()
+            if ret:
+                frames.append(self.prepare_detection_frame(frame))
+        cap.release()
+        return frames
+
+    #Method to threshold the foreground mask into a reused buffer, optionally cleaning it up with a morphological opening
+    def threshold_mask(self, fgmask):
+        if self.thresh_buffer is None or self.thresh_buffer.shape != fgmask.shape:
+            self.thresh_buffer = np.empty_like(fgmask)
+        thresh = self.thresh_buffer
+        cv2.threshold(fgmask, 200, 255, cv2.THRESH_BINARY, dst=thresh)
+        if self.morph_kernel > 1:
+            if self.morph_element is None or self.morph_element.shape[0] != self.morph_kernel:
+                self.morph_element = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (self.morph_kernel, self.morph_kernel))
+            #Opening removes speckles smaller than the kernel before they become contours
+            cv2.morphologyEx(thresh, cv2.MORPH_OPEN, self.morph_element, dst=thresh)
+        return thresh
+
+    #Method to find the bounding box of the largest foreground blob with area greater than sensitivity
+    def find_largest_blob(self, thresh):
+        #The sensitivity is in original pixels, so it shrinks with the downscale
+        min_area = self.sensitivity * self.detection_scale ** 2
+        if self.blob_method == 'components':
+            #Label every blob and get all bounding boxes in one pass
+            if self.labels_buffer is None or self.labels_buffer.shape != thresh.shape:
+                self.labels_buffer = np.empty(thresh.shape, dtype=np.int32)
+            count, labels, stats, _ = cv2.connectedComponentsWithStatsWithAlgorithm(thresh, 8, cv2.CV_32S, cv2.CCL_GRANA, labels=self.labels_buffer)
+            boxes = stats[1:count, :4]
+            #A contour through pixel centers encloses at most (w - 1) * (h - 1), so blobs are measured largest bound first
+            #until no other blob can be larger; blobs inside another blob's hole are always smaller than it
+            bounds = (boxes[:, 2] - 1) * (boxes[:, 3] - 1)
+            largest, largest_area, largest_start = None, -1.0, None
+            for i in np.argsort(-bounds, kind='stable'):
+                if bounds[i] < largest_area:
+                    break
+                area, start = self.blob_contour_area(labels, i + 1, boxes[i])
+                #findContours lists blobs from the last to start in raster order and the contour path keeps the first of equal areas
+                if area > largest_area or (area == largest_area and start > largest_start):
+                    largest, largest_area, largest_start = i, area, start
+            if largest is None or largest_area <= min_area:
+                return None
+            return tuple(int(v) for v in boxes[largest])
+        if self.blob_method != 'contours':
+            raise ValueError(f"Unknown blob_method: {self.blob_method}")
+        contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        if not contours:
+            return None
+        # Find the largest contour with area greater than sensitivity, computing each area once
+        areas = [cv2.contourArea(contour) for contour in contours]
+        largest = max(range(len(areas)), key=areas.__getitem__)
+        if areas[largest] <= min_area:
+            return None
+        #Around the contour, draw the smallest possible rectangle
+        return cv2.boundingRect(contours[largest])
+
+    #Method to get the contour area of one labelled blob, as cv2.contourArea gives it on the contour path, and its first pixel in raster order
+    def blob_contour_area(self, labels, label, box):
+        x, y, w, h = (int(v) for v in box)
+        #A zero border keeps the blob off the edge of the image it is traced in
+        blob = np.zeros((h + 2, w + 2), dtype=np.uint8)
+        np.equal(labels[y:y + h, x:x + w], label, out=blob[1:-1, 1:-1].view(bool))
+        contours, _ = cv2.findContours(blob, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        return cv2.contourArea(contours[0]), (y, x + int(np.argmax(blob[1, 1:-1])))
+
+    #Method to apply background subtraction and thresholding to a frame, returning the foreground mask of the detection frame
+    def foreground_mask(self, frame):
+        fgmask = self.background_model().apply(self.prepare_detection_frame(frame))
+        thresh = self.threshold_mask(fgmask)
+        if self.output_transform is not None:
+            if self.detection_mask is None or self.detection_mask.shape != thresh.shape:
+                self.detection_mask = self.build_detection_mask(thresh.shape)
+            cv2.bitwise_and(thresh, self.detection_mask, dst=thresh)
+        return thresh
+
+    #Method to get the center point and bounding box, in output pixels, of a blob found on the detection frame
+    def locate_blob(self, bbox):
+        if bbox is None:
+            return None, None
+        #Use the midpoint of the blob's bounding box, in original pixel coordinates, as the center point
+        (x, y, w, h) = self.to_frame_coordinates(bbox)
+        if self.output_transform is None:
+            center = (int(x + w/2), int(y + h/2))
+            return center, (int(x), int(y), int(round(w)), int(round(h)))
+        #With rotation or crop only the center and box are mapped to output pixels, the frame itself is never warped
+        (center_x, center_y), = self.to_output_points([(x + w/2, y + h/2)])
+        corners = self.to_output_points([(x, y), (x + w, y), (x + w, y + h), (x, y + h)])
+        (box_x, box_y), (box_x_end, box_y_end) = corners.min(axis=0), corners.max(axis=0)
+        return (int(center_x), int(center_y)), (int(box_x), int(box_y), int(round(box_x_end - box_x)), int(round(box_y_end - box_y)))
+
+    #Method to detect the hamster in a frame
+    def detect(self, frame):
+        thresh = self.foreground_mask(frame)
+        center, bbox = self.locate_blob(self.find_largest_blob(thresh))
+        return center, bbox, thresh
+
+    #Method to find the region of the detection frame covering an arena, masking out the pixels of neighbouring arenas when the view is rotated
+    def locate_arena(self, arena, frame_shape, shape):
+        x, y, w, h = arena.compute_detection_window(frame_shape)
+        offset_x, offset_y = self.detection_window[:2]
+        scale = self.detection_scale
+        x0, y0 = max(0, int(np.floor((x - offset_x) * scale))), max(0, int(np.floor((y - offset_y) * scale)))
+        x1, y1 = min(shape[1], int(np.ceil((x + w - offset_x) * scale))), min(shape[0], int(np.ceil((y + h - offset_y) * scale)))
+        arena.arena_window = (x0, y0, x1 - x0, y1 - y0)
+        arena.detection_mask = None
+        if self.output_transform is not None:
+            #A rotated arena is a tilted rectangle in the video, so its bounding box overlaps its neighbours
+            x, y, w, h = arena.roi
+            corners = (self.to_video_points([(x, y), (x + w, y), (x + w, y + h), (x, y + h)]) - self.detection_window[:2]) * scale - (x0, y0)
+            arena.detection_mask = np.zeros((y1 - y0, x1 - x0), dtype=np.uint8)
+            cv2.fillPoly(arena.detection_mask, [np.round(corners).astype(np.int32)], 255)
+
+    #Method to detect the animal in every arena of a frame with a single background subtraction, returning a center and box per arena
+    def detect_arenas(self, frame):
+        thresh = self.foreground_mask(frame)
+        detections = []
+        for arena in self.arena_trackers:
+            if arena.arena_window is None:
+                self.locate_arena(arena, frame.shape, thresh.shape)
+            x, y, w, h = arena.arena_window
+            #Each arena's animal is the largest blob inside its own region
+            arena_thresh = thresh[y:y + h, x:x + w]
+            if arena.detection_mask is not None:
+                arena_thresh = cv2.bitwise_and(arena_thresh, arena.detection_mask)
+            bbox = arena.find_largest_blob(arena_thresh)
+            detections.append(self.locate_blob(None if bbox is None else (bbox[0] + x, bbox[1] + y, bbox[2], bbox[3])))
+        return detections, thresh
+
+    #Method to find the zone containing a center point
+    def find_zone(self, center):
+        '''
+        1. Each zone is painted once on a label raster, mapping every pixel to the zone containing it.
+        2. A rectangle contains the center only if it is strictly between the left and right edges and the top and bottom edges.
+        3. Ellipse and polygon zones contain every pixel inside their outline.
+        4. If the center point is inside multiple overlapping zones, the one with the smallest area is painted on top, so it is the main zone.
+        5. Looking up the center on the raster gives the main zone, or no zone, without scanning the zones every frame.
+        '''
+        if center is None:
+            return None
+        if self.zone_index is None:
+            self.zone_index = ZoneIndex(self.zones)
+        return self.zone_index.lookup(center)
+
+    #Method to update the last known zone and position with a new detection
+    def update_position(self, center, current_zone):
+        if center is not None:
+            self.rat_positions.append(center)
+        # If no zone is found, use the last known zone and the last known position
+        if current_zone is None and self.last_known_zone is not None:
+            center = self.rat_positions[-1] if self.rat_positions else None
+        # If a zone is found, update the last known zone
+        elif current_zone is not None:
+            self.last_known_zone = current_zone
+        return center, self.last_known_zone
+
+    #Method to turn a detection into a row of time, position and zone, applying the last known zone logic
+    def position_row(self, current_time, detected_center, detected_zone):
+        center, zone = self.update_position(detected_center, detected_zone)
+        return [current_time, center[0] if center else None, center[1] if center else None, zone]
+
+    #Method to turn a frame into a row of time, position and zone, or a list with a row per arena
+    #The time is the frame's position in the video unless it is given, as for frames captured live
+    def process_frame(self, frame, frame_num, current_time=None):
+        if current_time is None:
             current_time = frame_num / self.fps
+        if self.arena_trackers:
+            detections, thresh = self.detect_arenas(frame)
+            rows = [arena.position_row(current_time, center, arena.find_zone(center)) for arena, (center, _) in zip(self.arena_trackers, detections)]
+            return rows, [bbox for _, bbox in detections], thresh
+        detected_center, bbox, thresh = self.detect(frame)
+        return self.position_row(current_time, detected_center, self.find_zone(detected_center)), bbox, thresh
+
+    #Method to draw the bounding box, zone and coordinates of a detection on a frame
+    def draw_detection(self, frame, row, bbox):
+        center = (row[1], row[2]) if row[1] is not None else None
+        #If a center is found in this frame, draw the bounding box and the zone and coordinates
+        if bbox is not None:
+            (x, y, w, h) = bbox
+            cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
+            if row[3] is not None:
+                cv2.putText(frame, f"Zone: {row[3]}, Coordinates: {center}", (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0,255,0), 2)
+
+    #Method to draw the numbered zones on a frame
+    def draw_zones(self, frame):
+        for i, zone in enumerate(self.zones):
+            draw_zone(frame, zone, (255, 0, 0), 2)
+            zx, zy, _, _ = zone_bounds(zone)
+            cv2.putText(frame, str(i + 1), (zx + 5, zy + 20), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (255,255,255), 2)
+
+    #Method to draw the detections and zones on a frame and show it with the thresholded frame
+    def draw_overlay(self, frame, row, bbox, thresh):
+        if self.arena_trackers:
+            for arena, arena_row, arena_bbox in zip(self.arena_trackers, row, bbox):
+                draw_zone(frame, arena.roi, (0, 255, 255), 1)
+                arena.draw_detection(frame, arena_row, arena_bbox)
+                arena.draw_zones(frame)
+        else:
+            self.draw_detection(frame, row, bbox)
+            self.draw_zones(frame)
+        #Show the thresholded frame and the original frame with zones
+        cv2.imshow('Thresholded Frame', thresh)
+        cv2.imshow('Frame', frame)
+
+    #Method to read frames from start_frame up to, but not including, end_frame (or the end of the video)
+    def read_frames(self, start_frame, end_frame=None):
+        self.seek(start_frame)
+        frame_num = start_frame
+        while end_frame is None or frame_num < end_frame:
             ret, frame = self.cap.read()
             if not ret:
                 break
-            #Apply background subtraction and thresholding
-            fgmask = self.fgbg.apply(frame)
-            _, thresh = cv2.threshold(fgmask, 200, 255, cv2.THRESH_BINARY)
-            contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-            '''
-            1. We have a contour of interest.
-            2. Around this shape, draw the smallest possible rectangle.
-            3. Find the midpoint of this rectangle; this is our center point.
-
-            4. To determine if the center point is inside a designated area (zone):
-            - Each zone has defined boundaries: left, right, top, and bottom edges.
-            - The x-coordinate of the center should be between the left and right edges.
-            - The y-coordinate of the center should be between the top and bottom edges.
-            - If both conditions are met, the center is inside that zone.
-
-            5. If the center point is inside multiple overlapping zones, identify all such zones.
-            6. Out of these zones, choose the one with the smallest area as the main zone.
-            7. If no shape is identified, we don't have a main zone.
-            '''
-            #Initialize current zone and center
-            current_zone = None
-            center = None
-            # Find the largest contour with area greater than sensitivity
-            largest_contour = max((contour for contour in contours if cv2.contourArea(contour) > self.sensitivity), key=cv2.contourArea, default=None)
-            # If a valid largest contour is found, perform the operations
-            if largest_contour is not None:
-                (x, y, w, h) = cv2.boundingRect(largest_contour)
-                center = (int(x + w/2), int(y + h/2))
-                self.rat_positions.append(center)
-                # Check if the center is inside any zone
-                zone_areas = [(i+1, zw*zh) for i, (zx, zy, zw, zh) in enumerate(self.zones) if zx < center[0] < zx + zw and zy < center[1] < zy + zh]
-                if zone_areas:
-                    zone_areas.sort(key=lambda x: x[1])
-                    current_zone = zone_areas[0][0]
-            else:
-                current_zone = None
-            # If no zone is found, use the last known zone and the last known position
-            if current_zone is None and self.last_known_zone is not None:
-                current_zone = self.last_known_zone
-                center = self.rat_positions[-1] if self.rat_positions else None
-            # If a zone is found, update the last known zone
-            elif current_zone is not None:
-                self.last_known_zone = current_zone
-            #Write the current time, position and zone to the CSV file
-            self.writer.writerow([current_time, center[0] if center else None, center[1] if center else None, self.last_known_zone])
-            print('Time:', current_time, 'Position:', center, 'Zone:', self.last_known_zone)
-            #If show_video is true and a center is found, draw the bounding box and the zone and coordinates
-            if self.show_video and center:
-                cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
-                if current_zone is not None:
-                    cv2.putText(frame, f"Zone: {current_zone}, Coordinates: {center}", (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0,255,0), 2)
-            #If show_video is true, show the thresholded frame and the original frame with zones
-            if self.show_video:
-                cv2.imshow('Thresholded Frame', thresh)
-                for i, zone in enumerate(self.zones):
-                    cv2.rectangle(frame, (zone[0], zone[1]), (zone[0] + zone[2], zone[1] + zone[3]), (255, 0, 0), 2)
-                    cv2.putText(frame, str(i + 1), (zone[0] + 5, zone[1] + 20), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (255,255,255), 2)
-                cv2.imshow('Frame', frame)
-                #Break the loop if 'q' is pressed
-                if cv2.waitKey(1) & 0xFF == ord('q'):
+            yield frame_num, frame
+            frame_num += 1
+
+    #Method to read the frames to process from start_frame, with a flag telling if each frame is sampled or only fed to the background model
+    #A resumed run passes the stride saved in its checkpoint as start_stride, so it samples the frames the interrupted run would have
+    def sample_frames(self, start_frame, end_frame=None, start_stride=None):
+        if self.skip_mode not in ('feed', 'grab'):
+            raise ValueError(f"Unknown skip_mode: {self.skip_mode}")
+        self.current_stride = start_stride or self.initial_stride()
+        self.seek(start_frame)
+        frame_num = start_frame
+        next_sample = start_frame
+        while end_frame is None or frame_num < end_frame:
+            sampled = frame_num == next_sample
+            #Skipped frames are still decoded for the background model in 'feed' mode, or only grabbed in 'grab' mode
+            if sampled or self.skip_mode == 'feed':
+                ret, frame = self.cap.read()
+                if not ret:
                     break
-        #Release the VideoCapture object and destroy all windows
-        self.cap.release()
-        cv2.destroyAllWindows()
-        #Close the CSV file
-        self.csv_file.close()
+                yield frame_num, frame, sampled
+            elif not self.cap.grab():
+                break
+            if sampled:
+                #The stride is read after the frame is handed over so adaptive sampling can react to it
+                next_sample = frame_num + max(1, self.current_stride)
+            frame_num += 1
+
+    #Method to pick the samples from every frame read ahead by the decode thread, on the thread that runs detection
+    #The adaptive stride is only known once the previous sample is detected, so it cannot be chosen where the frames are read
+    def choose_samples(self, frames, start_frame, start_stride=None):
+        if self.skip_mode not in ('feed', 'grab'):
+            raise ValueError(f"Unknown skip_mode: {self.skip_mode}")
+        self.current_stride = start_stride or self.initial_stride()
+        next_sample = start_frame
+        try:
+            for frame_num, frame in frames:
+                sampled = frame_num == next_sample
+                #Frames between samples are dropped in 'grab' mode, as sample_frames would only grab them
+                if sampled or self.skip_mode == 'feed':
+                    yield frame_num, frame, sampled
+                if sampled:
+                    next_sample = frame_num + max(1, self.current_stride)
+        finally:
+            frames.close()
+
+    #Method to get the stride sampling starts with: every frame with adaptive sampling, otherwise frame_stride
+    def initial_stride(self):
+        return self.frame_stride if not self.adaptive_stride else 1
+
+    #Method to choose the stride to the next sample from how much the foreground changed
+    def update_stride(self, thresh):
+        if not self.adaptive_stride:
+            self.current_stride = self.frame_stride
+            return
+        area = cv2.countNonZero(thresh)
+        #Changes smaller than the sensitivity are speckle noise, not the animal moving
+        min_area = self.sensitivity * self.detection_scale ** 2
+        changed = abs(area - self.last_foreground_area) > self.adaptive_threshold * max(self.last_foreground_area, min_area)
+        self.last_foreground_area = area
+        #Back off towards frame_stride while the animal is stationary and go back to every frame as soon as it moves
+        self.current_stride = 1 if changed else min(2 * self.current_stride, self.frame_stride)
+
+    #Method to detect the hamster in a range of frames without applying the last known zone logic
+    #With arenas, each detection holds a list of centers and a list of zones, one per arena
+    def detect_frames(self, start_frame, end_frame=None, warmup_frames=0):
+        #Prime the background model on the frames before the range so it has the same history as a serial run
+        for frame_num, frame in self.read_frames(max(0, start_frame - warmup_frames), start_frame):
+            self.background_model().apply(self.prepare_detection_frame(frame))
+        for frame_num, frame, sampled in self.sample_frames(start_frame, end_frame):
+            if not sampled:
+                self.background_model().apply(self.prepare_detection_frame(frame))
+                continue
+            if self.arena_trackers:
+                detections, thresh = self.detect_arenas(frame)
+                self.update_stride(thresh)
+                centers = [center for center, _ in detections]
+                yield frame_num, centers, [arena.find_zone(center) for arena, center in zip(self.arena_trackers, centers)]
+                continue
+            center, _, thresh = self.detect(frame)
+            self.update_stride(thresh)
+            yield frame_num, center, self.find_zone(center)
+
+    #Method to turn detections from detect_frames into rows, carrying the last known zone and position across them
+    def stitch_detections(self, detections):
+        for frame_num, detected_center, detected_zone in detections:
+            if self.arena_trackers:
+                yield [arena.position_row(frame_num / self.fps, center, zone) for arena, center, zone in zip(self.arena_trackers, detected_center, detected_zone)]
+            else:
+                yield self.position_row(frame_num / self.fps, detected_center, detected_zone)
+
+    #Method to write a batch of rows to the CSV file, or each arena's rows to its own file, printing them if verbose
+    def write_rows(self, rows):
+        if self.arena_trackers:
+            for i, arena in enumerate(self.arena_trackers):
+                arena.writer.writerows([row[i] for row in rows])
+        else:
+            self.writer.writerows(rows)
+        if self.verbose:
+            for row in rows:
+                if self.arena_trackers:
+                    for arena, arena_row in zip(self.arena_trackers, row):
+                        print('Arena:', arena.base_file_name, 'Time:', arena_row[0], 'Position:', (arena_row[1], arena_row[2]) if arena_row[1] is not None else None, 'Zone:', arena_row[3])
+                else:
+                    print('Time:', row[0], 'Position:', (row[1], row[2]) if row[1] is not None else None, 'Zone:', row[3])
+
+    #Method to track the hamster from the start frame to the end of the video, reporting the frames read every 100 rows
+    def track(self, progress=None):
+        self.stage_times = StageTimer()
+        start_frame = self.checkpoint['start_frame'] if self.checkpoint is not None else self.frame_index
+        if self.checkpoint is not None:
+            if self.checkpoint['finished']:
+                print(f"{self.base_file_name} was already tracked to the end.")
+                self.cap.release()
+                self.close_output()
+                return 0
+            #Replay the frames before the checkpoint so the background model has the history it had when the run stopped
+            for frame_num, frame in self.read_frames(self.checkpoint['warmup_start'], self.frame_index):
+                self.background_model().apply(self.prepare_detection_frame(frame))
+        checkpoint_frames = int(self.checkpoint_seconds * self.fps)
+        next_checkpoint = self.frame_index + checkpoint_frames
+        next_frame = self.frame_index  #Frame tracking would continue from after the rows written so far
+        finished = False
+        #In pipeline mode decoding and writing run in their own threads, connected to detection by bounded queues
+        start_stride = self.checkpoint.get('current_stride') if self.checkpoint is not None else None
+        if self.pipeline and self.adaptive_stride:
+            frames = self.choose_samples(prefetch(self.read_frames(self.frame_index), self.queue_size, self.stage_times, 'decode'), self.frame_index, start_stride)
+        elif self.pipeline:
+            frames = prefetch(self.sample_frames(self.frame_index, start_stride=start_stride), self.queue_size, self.stage_times, 'decode')
+        else:
+            frames = timed(self.sample_frames(self.frame_index, start_stride=start_stride), self.stage_times, 'decode')
+        #Rows are flushed every frame when the video is shown so the printed output keeps up with playback
+        writer = BatchWriter(self.write_rows, self.stage_times, batch_size=1 if self.show_video else self.write_batch_size, threaded=self.pipeline, maxsize=self.queue_size)
+        rows_written = 0
+        frames_read = 0
+        try:
+            #Loop until the end of the video
+            for frame_num, frame, sampled in frames:
+                frames_read = frame_num + 1 - self.frame_index
+                start = time.perf_counter()
+                #Frames between samples only update the background model
+                if not sampled:
+                    self.background_model().apply(self.prepare_detection_frame(frame))
+                    self.stage_times.add('feed', time.perf_counter() - start)
+                    continue
+                row, bbox, thresh = self.process_frame(frame, frame_num)
+                self.update_stride(thresh)
+                self.stage_times.add('detect', time.perf_counter() - start)
+                #Write the current time, position and zone to the CSV file
+                writer.write(row)
+                rows_written += 1
+                next_frame = frame_num + max(1, self.current_stride)
+                if progress is not None and rows_written % 100 == 0:
+                    progress(frames_read)
+                if checkpoint_frames and frame_num >= next_checkpoint:
+                    writer.drain()
+                    self.save_checkpoint(next_frame, start_frame)
+                    next_checkpoint = frame_num + checkpoint_frames
+                #If show_video is true, show the frame with the detection drawn on it
+                if self.show_video:
+                    self.draw_overlay(self.transform_frame(frame), row, bbox, thresh)
+                    #Break the loop if 'q' is pressed
+                    if cv2.waitKey(1) & 0xFF == ord('q'):
+                        break
+            else:
+                finished = True
+        finally:
+            frames.close()
+            try:
+                writer.close()
+                #Every row is written now, so a run stopped with 'q', Ctrl+C or an error can be resumed from here
+                if checkpoint_frames:
+                    self.save_checkpoint(next_frame, start_frame, finished)
+            finally:
+                #Release the VideoCapture object and destroy all windows
+                self.cap.release()
+                if self.show_video:
+                    cv2.destroyAllWindows()
+                #Close the CSV file
+                self.close_output()
+        return frames_read
+
+    #Method to start the analysis
+    def run(self):
+        self.choose_start_frame()
+        return self.track()
+
+#Suffix and format version of the checkpoint saved next to the positions file
+CHECKPOINT_SUFFIX = '_checkpoint.json'
+CHECKPOINT_VERSION = 1
+
+#Keys that move the start frame in choose_start_frame, in seconds
+START_FRAME_KEYS = {ord('n'): 1, ord('p'): -1, ord('f'): 10, ord('b'): -10, ord('F'): 60, ord('B'): -60}
+
+#Keys that choose the shape drawn in define_zones
+ZONE_SHAPE_KEYS = {ord('r'): 'rect', ord('e'): 'ellipse', ord('o'): 'polygon'}
+
+#Settings saved to and loaded from config files along with the zones
+CONFIG_SETTINGS = ('sensitivity', 'roi', 'crop_to_zones', 'grayscale', 'detection_scale', 'frame_stride', 'skip_mode', 'adaptive_stride', 'adaptive_threshold', 'blob_method', 'morph_kernel', 'rotation', 'crop',
+                   'detector', 'detector_history', 'detect_shadows', 'diff_threshold', 'background_samples')
+
+#Function to convert a value read from a config file to the type of the setting's default
+def config_value(value, default):
+    if isinstance(value, list):
+        return tuple(value)
+    if isinstance(default, (bool, int, float)):
+        return type(default)(value)
+    return value
+
+#Function to check if a config path is a YAML file
+def is_yaml_file(config_path):
+    return os.path.splitext(config_path)[1].lower() in ('.yaml', '.yml')
+
+#Function to make sure PyYAML is available before reading or writing YAML
+def require_yaml():
+    if yaml is None:
+        raise ImportError("PyYAML is required for YAML config files. Install it with 'pip install pyyaml' or use a .json config.")
 
 def main():
     try:
         #Create a PawsitionPatrol object and run the analysis
         pawsition_patrol = PawsitionPatrol('./output')
         pawsition_patrol.select_video_file()
+        pawsition_patrol.set_rotation()
         pawsition_patrol.define_zones()
         pawsition_patrol.set_sensitivity()
         pawsition_patrol.set_show_video()
+        pawsition_patrol.export_config()
         pawsition_patrol.run()
     except Exception as e:
         #If an error occurs, print the error and wait for a user input to end
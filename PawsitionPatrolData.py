@@ -1,4 +1,6 @@
+import argparse
 import os
+from functools import cached_property
 import pandas as pd
 import matplotlib.pyplot as plt
 import tkinter as tk
@@ -6,22 +8,96 @@ import numpy as np
 from tkinter import filedialog
 import matplotlib.animation as animation
 import matplotlib.colors as mcolors
+from matplotlib.collections import LineCollection
+from PawsitionTrack import is_track, track_dir, load_track, ROW_DTYPES
+from PawsitionCache import outputs_current, add_cache_arguments, cache_from_args
+from PawsitionStream import stream_session, DEFAULT_CHUNK_ROWS
+from PawsitionMetrics import session_metrics, DEFAULT_METRICS_PARAMS
+
+# Plots of long sessions are drawn from at most this many evenly spaced rows, about one per pixel
+MAX_PLOT_POINTS = 5000
+MAX_ANIMATION_FRAMES = 1000
+# Every saved frame is drawn in full, so saved animations are shorter
+MAX_SAVED_ANIMATION_FRAMES = 300
+ANIMATION_TRAIL = 300
+ANIMATION_FPS = 30
+# Holds the cache key of the results the session's output files were written from
+OUTPUTS_KEY_SUFFIX = '_Outputs.key'
 
 class PawsitionPatrol:
-    def __init__(self, file_path):
-        self.file_path = file_path
+    def __init__(self, file_path, outlier_std=3, cache=None, metrics_params=None):
+        # Binary tracks are directories, so a selected header.json stands for its track
+        self.file_path = track_dir(file_path) if is_track(file_path) else file_path
         self.subject = self.extract_subject_from_filename()
-        self.data = self.load_data()
-        self.data_clean = self.clean_data()
-        self.seconds_per_zone, self.cumulative_time, self.entry_exit_times, self.zone_latency = self.analyze_data()
+        self.outlier_std = outlier_std
+        self.cache = cache
+        self.metrics_params = {**DEFAULT_METRICS_PARAMS, **(metrics_params or {})}
+
+    # The data and results are only loaded or computed when first used, so an unchanged session never reads its positions
+    @cached_property
+    def data(self):
+        return self.load_data()
+
+    @cached_property
+    def data_clean(self):
+        return self.clean_data()
+
+    @cached_property
+    def analysis(self):
+        return self.analyze_data()
+
+    @cached_property
+    def distances(self):
+        return self.calculate_distances()
+
+    @cached_property
+    def cache_key(self):
+        return self.cache.key(self.file_path, 'session', {'outlier_std': self.outlier_std, **self.metrics_params})
+
+    @cached_property
+    def results(self):
+        if self.cache is not None:
+            # A cached entry evicted before all of it is read falls back to computing the results
+            entry = self.cache.get(self.cache_key, self.compute_results)
+            if entry is not None:
+                return entry
+        results = self.compute_results()
+        return self.cache.put(self.cache_key, results) if self.cache is not None else results
+
+    def compute_results(self):
+        seconds_per_zone, _, entry_exit_times, zone_latency = self.analysis
+        valid_data, outliers = self.distances
+        return {'seconds_per_zone': seconds_per_zone, 'entry_exit_times': entry_exit_times, 'zone_latency': zone_latency,
+                'distance_traveled': valid_data['Distance'].sum(), 'outliers': len(outliers)}
+
+    @property
+    def seconds_per_zone(self):
+        return self.results['seconds_per_zone']
+
+    @property
+    def entry_exit_times(self):
+        return self.results['entry_exit_times']
+
+    @property
+    def zone_latency(self):
+        return self.results['zone_latency']
+
+    @property
+    def cumulative_time(self):
+        return self.analysis[1]
+
+    @cached_property
+    def metrics(self):
+        return session_metrics(self.data_clean, self.seconds_per_zone, self.zone_latency, self.subject, self.outlier_std, self.metrics_params)
 
     def extract_subject_from_filename(self):
-        file_name = os.path.basename(self.file_path)
-        return 'KM' + file_name.split('KM')[1].split('.')[0]
+        return extract_subject(self.file_path)
 
     def load_data(self):
         try:
-            return pd.read_csv(self.file_path)
+            if is_track(self.file_path):
+                return load_track(self.file_path)
+            return pd.read_csv(self.file_path, dtype=ROW_DTYPES)
         except Exception as e:
             print(f"Error loading data: {e}")
             return None
@@ -32,12 +108,12 @@ class PawsitionPatrol:
     def calculate_distances(self):
         data_with_distances = self.data_clean.copy()
         data_with_distances['Distance'] = np.sqrt(data_with_distances['Position X'].diff() ** 2 + data_with_distances['Position Y'].diff() ** 2)
-        data_with_distances['Distance'].fillna(0, inplace=True)
+        data_with_distances['Distance'] = data_with_distances['Distance'].fillna(0)
 
         median_distance = data_with_distances['Distance'].median()
         std_distance = data_with_distances['Distance'].std()
 
-        outlier_threshold = median_distance + 3 * std_distance
+        outlier_threshold = median_distance + self.outlier_std * std_distance
         outlier_mask = data_with_distances['Distance'] > outlier_threshold
         outliers = data_with_distances[outlier_mask]
 
@@ -47,10 +123,12 @@ class PawsitionPatrol:
 
         return valid_data, outliers
 
+    def output_path(self, suffix):
+        return os.path.join(os.path.dirname(self.file_path), self.subject + suffix)
+
     def write_distance_data_to_csv(self):
-        valid_data, outliers = self.calculate_distances()
-        output_dir = os.path.dirname(self.file_path)
-        output_file_path = os.path.join(output_dir, self.subject + '_Distance_Traveled.csv')
+        valid_data, outliers = self.distances
+        output_file_path = self.output_path('_Distance_Traveled.csv')
 
         with open(output_file_path, 'w', newline='') as f:
             valid_data.to_csv(f, index=False)
@@ -61,7 +139,8 @@ class PawsitionPatrol:
 
     def analyze_data(self):
         data_sorted = self.data_clean.sort_values('Time')
-        data_sorted['Time Difference'] = data_sorted['Time'].diff()
+        # Each row's zone holds until the next row, so thinned or irregularly sampled tracks are weighted by the time to the next sample
+        data_sorted['Time Difference'] = -data_sorted['Time'].diff(-1)
         seconds_per_zone = data_sorted.groupby('Zone')['Time Difference'].sum()
         cumulative_time = data_sorted.groupby('Zone')['Time Difference'].cumsum()
         zone_changes = data_sorted['Zone'].ne(data_sorted['Zone'].shift())
@@ -78,30 +157,56 @@ class PawsitionPatrol:
         return zone_latency
     
     def write_zone_latency_to_csv(self):
-        output_dir = os.path.dirname(self.file_path)
-        output_file_path = os.path.join(output_dir, self.subject + '_Zone_Latency.csv')
+        output_file_path = self.output_path('_Zone_Latency.csv')
         self.zone_latency.to_csv(output_file_path, index=False)
 
     def write_zone_times_to_csv(self):
         table_data = pd.DataFrame({'Zone': self.seconds_per_zone.index, 'Total Time': self.seconds_per_zone.values.round(3)})
-        table_data.to_csv(os.path.join(os.path.dirname(self.file_path), self.subject + '_Zone_Times.csv'), index=False)
+        table_data.to_csv(self.output_path('_Zone_Times.csv'), index=False)
+
+    def write_metrics_to_csv(self):
+        # One table per session: the whole session on the first row, then each zone
+        self.metrics.round(3).to_csv(self.output_path('_Metrics.csv'), index=False)
 
-    def plot_data(self):
+    def plot_data(self, plot_dir=None):
         zones = sorted(self.data_clean['Zone'].dropna().unique())
         num_zones = len(zones)
         cmap = plt.get_cmap('viridis')
         colors = {zone: cmap(i / num_zones) for i, zone in enumerate(zones)}
 
+        self.figures = {}
         self.scatter_plot_positions_over_time(colors)
         self.heatmap_of_positions()
         self.table_and_bar_plot_seconds_per_zone()
         self.plot_cumulative_time_per_zone()
         self.timeline_of_zone_entries(colors)
-        self.animate_positions_over_time()
+        self.animate_positions_over_time(MAX_ANIMATION_FRAMES if plot_dir is None else MAX_SAVED_ANIMATION_FRAMES)
+
+        if plot_dir is None:
+            plt.show()
+            return
+        # Save every figure and the animation instead of showing them, so plots can be made without a display
+        for name, fig in self.figures.items():
+            fig.savefig(os.path.join(plot_dir, f"{self.subject}_{name}.png"))
+            plt.close(fig)
+        if animation.writers.is_available('ffmpeg'):
+            animation_path, writer = f"{self.subject}_Animation.mp4", animation.FFMpegWriter(fps=ANIMATION_FPS)
+        else:
+            animation_path, writer = f"{self.subject}_Animation.gif", animation.PillowWriter(fps=ANIMATION_FPS)
+        self.animation.save(os.path.join(plot_dir, animation_path), writer=writer)
+        plt.close(self.animation_figure)
+        print(f"Plots saved to {plot_dir}")
+
+    def new_figure(self, name, **kwargs):
+        fig = plt.figure(**kwargs)
+        self.figures[name] = fig
+        return fig
 
     def scatter_plot_positions_over_time(self, colors):
-        plt.figure(figsize=(10, 8))
-        plt.scatter(self.data_clean['Position X'], self.data_clean['Position Y'], c=self.data_clean['Time'], cmap='viridis', alpha=0.7)
+        self.new_figure('Path', figsize=(10, 8))
+        # Long sessions have far more rows than the plot has pixels, so draw evenly spaced rows
+        data = self.data_clean.iloc[decimate(len(self.data_clean), MAX_PLOT_POINTS)]
+        plt.scatter(data['Position X'], data['Position Y'], c=data['Time'], cmap='viridis', alpha=0.7)
         plt.colorbar(label='Time')
         plt.xlabel('Position X')
         plt.ylabel('Position Y')
@@ -110,7 +215,7 @@ class PawsitionPatrol:
         plt.grid(True)
 
     def heatmap_of_positions(self):
-        plt.figure(figsize=(10, 8))
+        self.new_figure('Heatmap', figsize=(10, 8))
         plt.hist2d(self.data_clean['Position X'], self.data_clean['Position Y'], bins=[50,50], cmap='coolwarm')
         plt.colorbar(label='Frequency')
         plt.xlabel('Position X')
@@ -120,7 +225,8 @@ class PawsitionPatrol:
         plt.grid(True)
 
     def table_and_bar_plot_seconds_per_zone(self):
-        fig, ax = plt.subplots(figsize=(8, 4))
+        fig = self.new_figure('Zone_Table', figsize=(8, 4))
+        ax = fig.add_subplot()
         table_data = pd.DataFrame({'Zone': self.seconds_per_zone.index, 'Seconds': self.seconds_per_zone.values})
         table_data['Seconds'] = table_data['Seconds'].round(3)
         table = ax.table(cellText=table_data.values, colLabels=table_data.columns, cellLoc='center', loc='center',
@@ -134,7 +240,7 @@ class PawsitionPatrol:
         print("Sum of Seconds in Each Zone:")
         print(table_data.to_string(index=False))
 
-        plt.figure(figsize=(10, 6))
+        self.new_figure('Zone_Seconds', figsize=(10, 6))
         self.seconds_per_zone.plot(kind='bar', color='skyblue', edgecolor='black')
         plt.xlabel('Zone')
         plt.ylabel('Seconds')
@@ -142,10 +248,12 @@ class PawsitionPatrol:
         plt.grid(axis='y')
 
     def plot_cumulative_time_per_zone(self):
-        plt.figure(figsize=(10, 6))
+        self.new_figure('Cumulative_Time', figsize=(10, 6))
         for zone in self.seconds_per_zone.index:
-            zone_cumulative_time = self.cumulative_time[self.data_clean['Zone'] == zone]
-            plt.plot(self.data_clean.loc[self.data_clean['Zone'] == zone, 'Time'], zone_cumulative_time, marker='o', linestyle='-', linewidth=2, markersize=5,
+            in_zone = self.data_clean['Zone'] == zone
+            rows = decimate(in_zone.sum(), MAX_PLOT_POINTS)
+            zone_cumulative_time = self.cumulative_time[in_zone].iloc[rows]
+            plt.plot(self.data_clean.loc[in_zone, 'Time'].iloc[rows], zone_cumulative_time, marker='o', linestyle='-', linewidth=2, markersize=5,
                     label='Zone {}'.format(zone))
         plt.xlabel('Time')
         plt.ylabel('Cumulative Time (Seconds)')
@@ -154,56 +262,135 @@ class PawsitionPatrol:
         plt.legend()
 
     def timeline_of_zone_entries(self, colors):
-        plt.figure(figsize=(15, 6))
-        for i in range(len(self.entry_exit_times) - 1):
-            if pd.notna(self.entry_exit_times.iloc[i, 1]):
-                plt.hlines(y=self.entry_exit_times.iloc[i, 1], xmin=self.entry_exit_times.iloc[i, 0], xmax=self.entry_exit_times.iloc[i+1, 0], 
-                        colors=colors[self.entry_exit_times.iloc[i, 1]], linestyles='solid', linewidth=15)
+        fig = self.new_figure('Timeline', figsize=(15, 6))
+        ax = fig.add_subplot()
+        times = self.entry_exit_times['Time'].to_numpy()
+        zones = self.entry_exit_times['Zone'].to_numpy()
+        # Draw every visit, from its entry to the next zone change, as one collection instead of a call per visit
+        visits = ~np.isnan(zones[:-1])
+        starts = np.column_stack((times[:-1], zones[:-1]))[visits]
+        ends = np.column_stack((times[1:], zones[:-1]))[visits]
+        ax.add_collection(LineCollection(np.stack((starts, ends), axis=1), colors=[colors[zone] for zone in zones[:-1][visits]], linewidths=15))
+        ax.autoscale()
         plt.xlabel('Time')
         plt.ylabel('Zone')
         plt.yticks(self.seconds_per_zone.index)
         plt.title('Timeline of Zone Entries')
         plt.grid(True)
 
-    def animate_positions_over_time(self):
-        fig = plt.figure()
+    def animate_positions_over_time(self, max_frames=MAX_ANIMATION_FRAMES):
+        fig = self.animation_figure = plt.figure()
         ax = plt.axes(xlim=(0, max(self.data_clean['Position X'])), ylim=(0, max(self.data_clean['Position Y'])))
 
         scatter, = ax.plot([], [], 'o')
 
+        # Precompute the points once; each animation frame shows the trail of rows leading up to it
+        x = self.data_clean['Position X'].to_numpy()
+        y = max(self.data_clean['Position Y']) - self.data_clean['Position Y'].to_numpy()
+        frames = decimate(len(x), max_frames)
+        trail = max(ANIMATION_TRAIL, frames[1] if len(frames) > 1 else 0)
+
         def init():
             scatter.set_data([], [])
             return scatter,
 
         def animate(i):
-            x = self.data_clean['Position X'].iloc[:i+1]
-            y = max(self.data_clean['Position Y']) - self.data_clean['Position Y'].iloc[:i+1]
-            scatter.set_data(x, y)
+            end = frames[i] + 1
+            scatter.set_data(x[max(0, end - trail):end], y[max(0, end - trail):end])
             return scatter,
 
-        anim = animation.FuncAnimation(fig, animate, init_func=init, frames=len(self.data_clean), interval=2, blit=True)
+        self.animation = animation.FuncAnimation(fig, animate, init_func=init, frames=len(frames), interval=2, blit=True)
 
-        plt.show()
+    def read_outputs_key(self):
+        try:
+            with open(self.output_path(OUTPUTS_KEY_SUFFIX)) as f:
+                return f.read().strip()
+        except OSError:
+            return None
 
-    def run(self):
-        if self.data is not None:
+    def write_outputs_key(self, key):
+        # Without a key the outputs are not known to match any parameters, so the next run rewrites them
+        path = self.output_path(OUTPUTS_KEY_SUFFIX)
+        if key is None:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        with open(path, 'w') as f:
+            f.write(key + '\n')
+
+    def is_unchanged(self):
+        # A session is unchanged if its results are cached for the same input and parameters, its output files are up to date,
+        # and they were written with those same parameters rather than by an earlier run with other ones
+        outputs = [self.output_path(suffix) for suffix in ('_Zone_Latency.csv', '_Zone_Times.csv', '_Distance_Traveled.csv', '_Metrics.csv')]
+        return (self.cache is not None and self.read_outputs_key() == self.cache_key and self.cache.get(self.cache_key) is not None
+                and outputs_current(self.file_path, outputs))
+
+    def run(self, plot=True, plot_dir=None):
+        if self.is_unchanged():
+            print(f"{self.subject} is unchanged, keeping its output files")
+        elif self.data is not None:
+            # The key is removed first, so outputs left half written by an interrupted run are never taken as current
+            self.write_outputs_key(None)
             self.write_zone_latency_to_csv()
             self.write_zone_times_to_csv()
             self.write_distance_data_to_csv()  # Save distance data to CSV
-            self.plot_data()
+            self.write_metrics_to_csv()
+            self.write_outputs_key(self.cache_key if self.cache is not None else None)
+        else:
+            return
+        if plot:
+            self.plot_data(plot_dir)
+
+    def run_streaming(self, chunk_rows=DEFAULT_CHUNK_ROWS):
+        # Write the same output files a chunk of rows at a time, for sessions too long to load at once; this draws no plots
+        # and writes no _Metrics.csv, so the outputs are never taken as current by a later run
+        self.write_outputs_key(None)
+        return stream_session(self.file_path, self.subject, outlier_std=self.outlier_std, chunk_rows=chunk_rows)
+
+def decimate(rows, max_points):
+    # Indices of at most max_points evenly spaced rows, always including the first
+    return np.arange(0, rows, max(1, -(-rows // max_points)))
+
+def extract_subject(file_path):
+    file_name = os.path.basename(os.path.normpath(file_path))
+    if 'KM' not in file_name:
+        # Files that don't follow the KM naming scheme are identified by their name
+        return file_name.split('.')[0]
+    return 'KM' + file_name.split('KM')[1].split('.')[0]
 
 def select_files():
     root = tk.Tk()
     root.withdraw()
-    return filedialog.askopenfilenames(title="Select CSV files", filetypes=(("CSV files", "*.csv"),))
-
-def main():
-    file_paths = select_files()
+    return filedialog.askopenfilenames(title="Select CSV files or track headers", filetypes=(("Position files", "*.csv header.json"), ("CSV files", "*.csv"), ("Track headers", "header.json")))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyze and plot PawsitionPatrol position files.")
+    parser.add_argument('files', nargs='*', help="Position CSV files or tracks (default: choose them in a dialog).")
+    parser.add_argument('--outlier-std', type=float, default=3, help="Steps longer than median + this many standard deviations are outliers (default: 3).")
+    parser.add_argument('--no-plots', action='store_true', help="Only write the output files.")
+    parser.add_argument('--save-plots', metavar='DIR', help="Save the plots and animation to DIR instead of showing them, without needing a display.")
+    parser.add_argument('--speed-window', type=float, default=DEFAULT_METRICS_PARAMS['speed_window'], help=f"Seconds the smoothed speed in _Metrics.csv is measured over (default: {DEFAULT_METRICS_PARAMS['speed_window']}).")
+    parser.add_argument('--immobile-speed', type=float, default=DEFAULT_METRICS_PARAMS['immobile_speed'], help=f"Smoothed speed in pixels per second below which the animal is immobile (default: {DEFAULT_METRICS_PARAMS['immobile_speed']}).")
+    parser.add_argument('--min-bout', type=float, default=DEFAULT_METRICS_PARAMS['min_bout'], help=f"Shortest immobility bout in seconds (default: {DEFAULT_METRICS_PARAMS['min_bout']}).")
+    parser.add_argument('--tortuosity-window', type=float, default=DEFAULT_METRICS_PARAMS['tortuosity_window'], help=f"Seconds of path in each window tortuosity is measured over (default: {DEFAULT_METRICS_PARAMS['tortuosity_window']}).")
+    parser.add_argument('--stream', action='store_true', help="Analyze each file a chunk of rows at a time with bounded memory (no plots or _Metrics.csv).")
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS, help=f"Rows read at a time with --stream (default: {DEFAULT_CHUNK_ROWS}).")
+    add_cache_arguments(parser)
+    args = parser.parse_args(argv)
+    cache = cache_from_args(args)
+    if args.save_plots:
+        plt.switch_backend('Agg')
+        os.makedirs(args.save_plots, exist_ok=True)
+    file_paths = args.files or select_files()
     if file_paths:
         for file_path in file_paths:
             print(f"Processing file: {file_path}")
-            patrol = PawsitionPatrol(file_path)
-            patrol.run()
+            metrics_params = {'speed_window': args.speed_window, 'immobile_speed': args.immobile_speed, 'min_bout': args.min_bout, 'tortuosity_window': args.tortuosity_window}
+            patrol = PawsitionPatrol(file_path, args.outlier_std, cache, metrics_params)
+            if args.stream:
+                patrol.run_streaming(args.chunk_rows)
+            else:
+                patrol.run(plot=not args.no_plots, plot_dir=args.save_plots)
     else:
         print("No files selected.")
 
@@ -0,0 +1,160 @@
+#Import required libraries
+import queue
+import threading
+import time
+from collections import defaultdict
+
+#Marker put on a queue when its producer is finished
+_END = object()
+
+#Class to accumulate the time spent in each stage of the tracking pipeline
+class StageTimer:
+    def __init__(self):
+        self.seconds = defaultdict(float)  #Busy time of each stage
+        self.counts = defaultdict(int)  #Number of items handled by each stage
+        self.start = time.perf_counter()
+        self.lock = threading.Lock()
+
+    #Method to add the time a stage spent on some items
+    def add(self, stage, seconds, count=1):
+        with self.lock:
+            self.seconds[stage] += seconds
+            self.counts[stage] += count
+
+    #Method to format the counters as a table, with the busiest stage marked as the bottleneck
+    def report(self):
+        wall = time.perf_counter() - self.start
+        busiest = max(self.seconds, key=self.seconds.get, default=None)
+        lines = [f"{'Stage':<10}{'Busy (s)':>10}{'Items':>10}{'ms/item':>10}{'% of wall':>11}"]
+        for stage, seconds in self.seconds.items():
+            count = self.counts[stage]
+            line = f"{stage:<10}{seconds:>10.2f}{count:>10}{1000 * seconds / count if count else 0:>10.3f}{100 * seconds / wall if wall else 0:>10.1f}%"
+            lines.append(line + ("  <- bottleneck" if stage == busiest else ""))
+        lines.append(f"Wall time: {wall:.2f} s")
+        return "\n".join(lines)
+
+#Function to time every item pulled from an iterable, for the stage that produces it
+def timed(iterable, timer, stage):
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        timer.add(stage, time.perf_counter() - start)
+        yield item
+
+#Function to run an iterable in a background thread, handing items over through a bounded queue
+def prefetch(iterable, maxsize, timer, stage):
+    items = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+    errors = []
+
+    def produce():
+        try:
+            for item in timed(iterable, timer, stage):
+                #Block while the queue is full so a fast producer cannot run ahead of the consumer
+                while not stop.is_set():
+                    try:
+                        items.put(item, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if stop.is_set():
+                    return
+        except Exception as e:
+            errors.append(e)
+        finally:
+            items.put(_END)
+
+    thread = threading.Thread(target=produce, name=f"{stage}-stage", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = items.get()
+            if item is _END:
+                break
+            yield item
+        if errors:
+            raise errors[0]
+    finally:
+        #Unblock and wait for the producer if the consumer stopped early
+        stop.set()
+        while thread.is_alive():
+            try:
+                items.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        thread.join()
+
+#Class to write rows in batches, optionally from a writer thread fed by a bounded queue
+class BatchWriter:
+    def __init__(self, write_rows, timer, batch_size=256, threaded=False, maxsize=8):
+        self.write_rows = write_rows  #Function that writes a list of rows
+        self.timer = timer
+        self.batch_size = batch_size
+        self.batch = []
+        self.errors = []
+        self.thread = None
+        if threaded:
+            self.batches = queue.Queue(maxsize=maxsize)
+            self.thread = threading.Thread(target=self.consume, name="write-stage", daemon=True)
+            self.thread.start()
+
+    #Method to queue one row, flushing a full batch
+    def write(self, row):
+        self.batch.append(row)
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    #Method to hand the current batch to the writer
+    def flush(self):
+        if self.errors:
+            raise self.errors[0]
+        batch, self.batch = self.batch, []
+        if not batch:
+            return
+        if self.thread is None:
+            self.write_batch(batch)
+        else:
+            self.batches.put(batch)
+
+    #Method to hand over the current batch and wait until every batch handed over so far is written
+    def drain(self):
+        self.flush()
+        if self.thread is not None:
+            self.batches.join()
+        if self.errors:
+            raise self.errors[0]
+
+    #Method to write a batch and time it
+    def write_batch(self, batch):
+        start = time.perf_counter()
+        self.write_rows(batch)
+        self.timer.add('write', time.perf_counter() - start, len(batch))
+
+    #Method run by the writer thread
+    def consume(self):
+        while True:
+            batch = self.batches.get()
+            if batch is _END:
+                self.batches.task_done()
+                return
+            if not self.errors:
+                try:
+                    self.write_batch(batch)
+                except Exception as e:
+                    self.errors.append(e)
+            self.batches.task_done()
+
+    #Method to write the remaining rows and stop the writer thread
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            if self.thread is not None:
+                self.batches.put(_END)
+                self.thread.join()
+        if self.errors:
+            raise self.errors[0]
@@ -0,0 +1,173 @@
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+from PawsitionTrack import is_track, track_dir, open_track, ROW_COLUMNS, ROW_DTYPES
+
+DEFAULT_CHUNK_ROWS = 1000000
+# Distances are histogrammed by the top 16 bits of their float64 representation (sign, exponent and 4 mantissa bits),
+# which orders non-negative floats, so the median can be found exactly without holding every distance
+MEDIAN_BITS = 16
+
+def read_chunks(file_path, chunk_rows=DEFAULT_CHUNK_ROWS):
+    # Yield the rows with a position, as in clean_data, a chunk at a time
+    if is_track(file_path):
+        _, columns = open_track(file_path)
+        for start in range(0, len(columns['Time']), chunk_rows):
+            chunk = pd.DataFrame({column: np.array(columns[column][start:start + chunk_rows]) for column in ROW_COLUMNS})
+            chunk['Zone'] = chunk['Zone'].where(chunk['Zone'] != 0).astype(float)
+            yield chunk.dropna(subset=['Position X', 'Position Y'])
+    else:
+        for chunk in pd.read_csv(file_path, chunksize=chunk_rows, dtype=ROW_DTYPES):
+            yield chunk.dropna(subset=['Position X', 'Position Y'])
+
+class ZoneTimeAccumulator:
+    # Sample-and-hold zone times and zone changes of rows fed in time order, as in PawsitionPatrol.analyze_data
+    def __init__(self):
+        self.seconds = pd.Series(dtype=float)
+        self.last_time = None
+        self.last_zone = np.nan
+        self.last_entry = np.nan
+
+    def update(self, times, zones):
+        times = np.asarray(times, dtype=float)
+        zones = np.asarray(zones, dtype=float)
+        if not len(times):
+            return pd.DataFrame({'Time': times, 'Zone': zones})
+        if np.any(np.diff(times) < 0) or (self.last_time is not None and times[0] < self.last_time):
+            raise ValueError("Rows must be in time order to be analyzed as a stream")
+        # Each row's zone holds until the next row, so the first row of a chunk closes the previous chunk's last row
+        held_times = np.diff(times, prepend=np.nan if self.last_time is None else self.last_time)
+        held_zones = np.concatenate(([self.last_zone], zones[:-1]))
+        self.seconds = self.seconds.add(pd.Series(held_times).groupby(held_zones).sum(), fill_value=0)
+        # A zone is entered wherever it differs from the previous row; rows without a zone never equal each other
+        changes = zones != held_zones
+        self.last_time, self.last_zone = times[-1], zones[-1]
+        return pd.DataFrame({'Time': times[changes], 'Zone': zones[changes]})
+
+    def seconds_per_zone(self):
+        return self.seconds.sort_index().rename_axis('Zone').rename('Time Difference')
+
+    def zone_latency(self, entries, subject):
+        # Same columns as PawsitionPatrol.calculate_zone_latency, with the exiting zone carried across chunks
+        entering = entries['Zone'].to_numpy()
+        exiting = np.concatenate(([self.last_entry], entering))[:len(entering)]
+        if len(entering):
+            self.last_entry = entering[-1]
+        return pd.DataFrame({'Subject': subject, 'Zone Change Time': entries['Time'].to_numpy(),
+                             'Entering Zone': entering, 'Exiting Zone': exiting})
+
+class DistanceAccumulator:
+    # Step distances between consecutive positions, with the running count, mean, variance and median histogram of every step
+    def __init__(self):
+        self.last_position = None
+        self.last_cumulative = None
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.histogram = np.zeros(1 << MEDIAN_BITS, dtype=np.int64)
+
+    def steps(self, x, y):
+        x, y = np.asarray(x), np.asarray(y)
+        if not len(x):
+            return np.empty(0, dtype=x.dtype)
+        # Keep the positions' dtype so the steps match calculate_distances bit for bit
+        previous = self.last_position or (x[:1], y[:1])
+        distance = np.sqrt(np.diff(x, prepend=previous[0]) ** 2 + np.diff(y, prepend=previous[1]) ** 2)
+        self.last_position = (x[-1:], y[-1:])
+        return distance
+
+    def update(self, distance):
+        if not len(distance):
+            return
+        # Combine the chunk's mean and squared deviations with the running ones (Chan et al.)
+        distance = np.asarray(distance, dtype=np.float64)
+        count, mean = len(distance), distance.mean()
+        m2 = ((distance - mean) ** 2).sum()
+        delta = mean - self.mean
+        total = self.count + count
+        self.mean += delta * count / total
+        self.m2 += m2 + delta ** 2 * self.count * count / total
+        self.count = total
+        self.histogram += np.bincount(median_bins(distance), minlength=len(self.histogram))
+
+    def std(self):
+        return np.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else np.nan
+
+    def cumulative(self, distance):
+        # Continue the running cumulative sum exactly as one cumsum over the whole session would
+        if self.last_cumulative is None:
+            cumulative = np.cumsum(distance)
+        else:
+            cumulative = np.cumsum(np.concatenate((self.last_cumulative, distance)))[1:]
+        if len(cumulative):
+            self.last_cumulative = cumulative[-1:]
+        return cumulative
+
+def median_bins(distance):
+    return (np.ascontiguousarray(distance, dtype=np.float64).view(np.uint64) >> np.uint64(64 - MEDIAN_BITS)).astype(np.intp)
+
+def spilled_median(spill_path, histogram, count, chunk_rows=DEFAULT_CHUNK_ROWS):
+    # The middle ranks fall in one or two histogram bins, so only the distinct values in those bins are collected
+    if not count:
+        return np.nan
+    ranks = [(count - 1) // 2, count // 2]
+    cumulative = np.cumsum(histogram)
+    bins = np.searchsorted(cumulative, ranks, side='right')
+    values = {}
+    spill = np.memmap(spill_path, dtype=np.float64, mode='r')
+    for start in range(0, len(spill), chunk_rows):
+        chunk = np.asarray(spill[start:start + chunk_rows])
+        chunk = chunk[np.isin(median_bins(chunk), bins)]
+        for value, n in zip(*np.unique(chunk, return_counts=True)):
+            values[value] = values.get(value, 0) + n
+    del spill
+    # Walk the sorted values from the first collected rank to the middle ranks
+    sorted_values = sorted(values)
+    positions = np.cumsum([values[value] for value in sorted_values]) + (cumulative[bins[0] - 1] if bins[0] else 0)
+    middle = [sorted_values[np.searchsorted(positions, rank, side='right')] for rank in ranks]
+    return (middle[0] + middle[1]) / 2
+
+def stream_session(file_path, subject, output_dir=None, outlier_std=3, chunk_rows=DEFAULT_CHUNK_ROWS):
+    # Write the _Zone_Latency, _Zone_Times and _Distance_Traveled files of a session with memory bounded by chunk_rows
+    file_path = track_dir(file_path) if is_track(file_path) else file_path
+    output_dir = output_dir or os.path.dirname(file_path)
+    latency_path = os.path.join(output_dir, subject + '_Zone_Latency.csv')
+    zone_times = ZoneTimeAccumulator()
+    distances = DistanceAccumulator()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # First pass: zone times and changes, and the distance statistics; distances are spilled to disk for the median
+        spill_path = os.path.join(temp_dir, 'distances.bin')
+        with open(spill_path, 'wb') as spill:
+            for i, chunk in enumerate(read_chunks(file_path, chunk_rows)):
+                entries = zone_times.update(chunk['Time'], chunk['Zone'])
+                zone_times.zone_latency(entries, subject).to_csv(latency_path, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+                distance = distances.steps(chunk['Position X'], chunk['Position Y'])
+                distances.update(distance)
+                spill.write(np.asarray(distance, dtype=np.float64).tobytes())
+        seconds_per_zone = zone_times.seconds_per_zone()
+        pd.DataFrame({'Zone': seconds_per_zone.index, 'Total Time': seconds_per_zone.values.round(3)}).to_csv(
+            os.path.join(output_dir, subject + '_Zone_Times.csv'), index=False)
+        threshold = spilled_median(spill_path, distances.histogram, distances.count, chunk_rows) + outlier_std * distances.std()
+
+        # Second pass: valid steps with their cumulative distance, and the outliers, which follow them in the same file
+        distance_path = os.path.join(output_dir, subject + '_Distance_Traveled.csv')
+        outliers_path = os.path.join(temp_dir, 'outliers.csv')
+        open(outliers_path, 'w').close()
+        steps = DistanceAccumulator()
+        distance_traveled, outlier_count = 0.0, 0
+        for i, chunk in enumerate(read_chunks(file_path, chunk_rows)):
+            chunk['Distance'] = steps.steps(chunk['Position X'], chunk['Position Y'])
+            outlier = chunk['Distance'].to_numpy() > threshold
+            valid = chunk[~outlier].copy()
+            valid['Cumulative Distance'] = steps.cumulative(valid['Distance'].to_numpy())
+            valid.to_csv(distance_path, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+            chunk[outlier].to_csv(outliers_path, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+            distance_traveled += valid['Distance'].sum()
+            outlier_count += int(outlier.sum())
+        with open(distance_path, 'a', newline='') as f, open(outliers_path) as outliers:
+            f.write('\nOutliers\n')
+            for line in outliers:
+                f.write(line)
+    print(f"Distance data and outliers saved to {distance_path}")
+    return {'seconds_per_zone': seconds_per_zone, 'distance_traveled': distance_traveled, 'outliers': outlier_count, 'threshold': threshold}
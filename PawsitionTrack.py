@@ -0,0 +1,133 @@
+#Import required libraries
+import argparse
+import json
+import os
+import numpy as np
+import pandas as pd
+
+#A track is a directory holding header.json and one raw little-endian binary file per column.
+#Rows are appended to every column file in batches, so the number of rows is the size of the
+#shortest column file and a track cut short by a crash can still be read up to its last batch.
+TRACK_EXTENSION = '.track'
+TRACK_VERSION = 1
+TRACK_COLUMNS = {'Frame': '<i4', 'Time': '<f8', 'Position X': '<f4', 'Position Y': '<f4', 'Zone': '<i2'}
+#Columns written by the tracker, in the order of a _positions.csv row
+ROW_COLUMNS = ['Time', 'Position X', 'Position Y', 'Zone']
+#Types a _positions.csv is read with; otherwise pandas picks them per read, so a whole file and its chunks could differ
+ROW_DTYPES = dict.fromkeys(ROW_COLUMNS, float)
+
+#Function to get the file name of a column inside a track directory
+def column_file(track_path, column):
+    return os.path.join(track_path, column.replace(' ', '_') + '.bin')
+
+#Function to check if a path is a track directory, or the header.json inside one
+def is_track(path):
+    path = track_dir(path)
+    return path.endswith(TRACK_EXTENSION) or os.path.isfile(os.path.join(path, 'header.json'))
+
+#Function to get the track directory from a track path or the header.json inside it
+def track_dir(path):
+    path = os.path.normpath(path)
+    return os.path.dirname(path) if os.path.basename(path) == 'header.json' else path
+
+#Class to write position rows to a track in typed column batches, with the same writerow/writerows interface as csv.writer
+class TrackWriter:
+    def __init__(self, track_path, metadata, append=False):
+        self.track_path = track_path
+        self.fps = metadata['fps']
+        os.makedirs(track_path, exist_ok=True)
+        with open(os.path.join(track_path, 'header.json'), 'w') as f:
+            json.dump({'version': TRACK_VERSION, 'columns': TRACK_COLUMNS, **metadata}, f, indent=2)
+        mode = 'ab' if append else 'wb'
+        self.files = {column: open(column_file(track_path, column), mode) for column in TRACK_COLUMNS}
+
+    #Method to write one row of time, position X, position Y and zone
+    def writerow(self, row):
+        self.writerows([row])
+
+    #Method to write a batch of rows as one append to every column file
+    def writerows(self, rows):
+        rows = np.array(list(rows), dtype=float).reshape(-1, len(ROW_COLUMNS))
+        if not len(rows):
+            return
+        columns = dict(zip(ROW_COLUMNS, rows.T))
+        #Zones are 1-based, so 0 marks rows without a zone
+        columns['Zone'] = np.nan_to_num(columns['Zone'], nan=0)
+        columns['Frame'] = np.rint(columns['Time'] * self.fps)
+        for column, dtype in TRACK_COLUMNS.items():
+            self.files[column].write(columns[column].astype(dtype).tobytes())
+
+    #Method to flush every column file, and with sync make sure it reached the disk
+    def flush(self, sync=False):
+        for f in self.files.values():
+            f.flush()
+            if sync:
+                os.fsync(f.fileno())
+
+    #Method to close every column file
+    def close(self):
+        for f in self.files.values():
+            f.close()
+
+#Function to read the header of a track
+def read_header(track_path):
+    with open(os.path.join(track_dir(track_path), 'header.json')) as f:
+        return json.load(f)
+
+#Function to count the complete rows of a track, the rows every column file has
+def track_rows(track_path, header=None):
+    track_path = track_dir(track_path)
+    columns = (header or read_header(track_path))['columns']
+    return min(os.path.getsize(column_file(track_path, column)) // np.dtype(dtype).itemsize for column, dtype in columns.items())
+
+#Function to cut every column of a track back to its first rows, so writing can continue after them
+def truncate_track(track_path, rows):
+    track_path = track_dir(track_path)
+    if track_rows(track_path) < rows:
+        raise IOError(f"{track_path} has fewer than {rows} rows")
+    for column, dtype in read_header(track_path)['columns'].items():
+        os.truncate(column_file(track_path, column), rows * np.dtype(dtype).itemsize)
+
+#Function to memory-map every column of a track without copying it, returning the header and a dictionary of arrays
+def open_track(track_path):
+    track_path = track_dir(track_path)
+    header = read_header(track_path)
+    dtypes = {column: np.dtype(dtype) for column, dtype in header['columns'].items()}
+    rows = track_rows(track_path, header)
+    columns = {}
+    for column, dtype in dtypes.items():
+        #np.memmap cannot map an empty file
+        columns[column] = np.memmap(column_file(track_path, column), dtype=dtype, mode='r', shape=(rows,)) if rows else np.empty(0, dtype)
+    return header, columns
+
+#Function to load a track as a DataFrame with the same columns and missing values as a _positions.csv file
+def load_track(track_path, columns=None):
+    _, arrays = open_track(track_path)
+    data = pd.DataFrame({column: arrays[column] for column in (columns or ROW_COLUMNS)}, copy=False)
+    if 'Zone' in data:
+        data['Zone'] = data['Zone'].where(data['Zone'] != 0).astype(float)
+    return data
+
+#Function to export a track to a _positions.csv file, a chunk of rows at a time
+def export_csv(track_path, csv_path=None, chunk_size=1000000):
+    track_path = track_dir(track_path)
+    if csv_path is None:
+        csv_path = os.path.splitext(track_path)[0] + '.csv'
+    data = load_track(track_path)
+    for start in range(0, max(len(data), 1), chunk_size):
+        data.iloc[start:start + chunk_size].to_csv(csv_path, mode='w' if start == 0 else 'a', header=start == 0, index=False)
+    return csv_path
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect or export PawsitionPatrol track files.")
+    parser.add_argument('tracks', nargs='+', help="Track directories (or their header.json).")
+    parser.add_argument('--csv', action='store_true', help="Export each track to a CSV file next to it.")
+    args = parser.parse_args(argv)
+    for track_path in args.tracks:
+        header, columns = open_track(track_path)
+        print(f"{track_dir(track_path)}: {len(columns['Time'])} rows, {header.get('fps')} fps, video {header.get('video')}")
+        if args.csv:
+            print(f"  exported to {export_csv(track_path)}")
+
+if __name__ == "__main__":
+    main()
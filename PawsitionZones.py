@@ -0,0 +1,116 @@
+#Import required libraries
+import cv2
+import numpy as np
+
+#Zones are rectangles stored as (x, y, width, height) tuples, or dictionaries for other shapes:
+#{'shape': 'ellipse', 'center': (x, y), 'axes': (half width, half height), 'angle': degrees}
+#{'shape': 'polygon', 'points': [(x, y), ...]}
+
+#Function to convert a zone read from a config file into a rectangle tuple or shape dictionary
+def normalize_zone(zone):
+    if isinstance(zone, dict):
+        shape = zone.get('shape')
+        if shape == 'rect':
+            return tuple(int(v) for v in zone['rect'])
+        if shape == 'ellipse':
+            return {'shape': 'ellipse', 'center': tuple(int(v) for v in zone['center']), 'axes': tuple(int(v) for v in zone['axes']), 'angle': float(zone.get('angle', 0))}
+        if shape == 'polygon':
+            points = [tuple(int(v) for v in point) for point in zone['points']]
+            if len(points) < 3:
+                raise ValueError("A polygon zone needs at least 3 points")
+            return {'shape': 'polygon', 'points': points}
+        raise ValueError(f"Unknown zone shape: {shape}")
+    if len(zone) != 4:
+        raise ValueError(f"A rectangle zone needs x, y, width and height, got {zone}")
+    return tuple(int(v) for v in zone)
+
+#Function to turn the points clicked in define_zones into a zone, or None if the zone is not finished
+def zone_from_points(points, shape):
+    if shape == 'polygon':
+        return {'shape': 'polygon', 'points': [tuple(point) for point in points]} if len(points) >= 3 else None
+    if len(points) < 2:
+        return None
+    x, y, w, h = cv2.boundingRect(np.array(points))
+    if shape == 'ellipse':
+        return {'shape': 'ellipse', 'center': (x + w // 2, y + h // 2), 'axes': (w // 2, h // 2), 'angle': 0.0}
+    return (x, y, w, h)
+
+#Function to convert a zone into a value that can be saved to a JSON or YAML config file
+def zone_to_config(zone):
+    if isinstance(zone, dict):
+        return {key: [list(point) for point in value] if key == 'points' else list(value) if isinstance(value, tuple) else value for key, value in zone.items()}
+    return list(zone)
+
+#Function to get the outline of an ellipse or polygon zone as an array of points
+def zone_outline(zone):
+    if zone['shape'] == 'ellipse':
+        return cv2.ellipse2Poly(zone['center'], zone['axes'], int(round(zone['angle'])), 0, 360, 5)
+    return np.array(zone['points'], dtype=np.int32)
+
+#Function to get the area of a zone, used to pick the smallest of overlapping zones
+def zone_area(zone):
+    if not isinstance(zone, dict):
+        return zone[2] * zone[3]
+    if zone['shape'] == 'ellipse':
+        return np.pi * zone['axes'][0] * zone['axes'][1]
+    return cv2.contourArea(zone_outline(zone))
+
+#Function to get the bounding rectangle (x, y, width, height) of a zone
+def zone_bounds(zone):
+    if not isinstance(zone, dict):
+        return zone
+    return cv2.boundingRect(zone_outline(zone))
+
+#Function to draw a zone's outline on a frame
+def draw_zone(frame, zone, color, thickness=2):
+    if not isinstance(zone, dict):
+        cv2.rectangle(frame, (zone[0], zone[1]), (zone[0] + zone[2], zone[1] + zone[3]), color, thickness)
+    elif zone['shape'] == 'ellipse':
+        cv2.ellipse(frame, zone['center'], zone['axes'], zone['angle'], 0, 360, color, thickness)
+    else:
+        cv2.polylines(frame, [zone_outline(zone)], True, color, thickness)
+
+#Function to paint a zone's inside pixels on a label raster
+def paint_zone(labels, zone, label):
+    if not isinstance(zone, dict):
+        #A center is inside a rectangle only strictly between its edges
+        x, y, w, h = zone
+        labels[max(0, y + 1):max(0, y + h), max(0, x + 1):max(0, x + w)] = label
+    elif zone['shape'] == 'ellipse':
+        cv2.ellipse(labels, zone['center'], zone['axes'], zone['angle'], 0, 360, label, -1)
+    else:
+        cv2.fillPoly(labels, [zone_outline(zone)], label)
+
+#Class to look up the zone of a point in constant time
+class ZoneIndex:
+    def __init__(self, zones):
+        bounds = [zone_bounds(zone) for zone in zones]
+        width = max((x + w for x, y, w, h in bounds), default=0) + 1
+        height = max((y + h for x, y, w, h in bounds), default=0) + 1
+        #Label raster mapping every pixel to the id of the smallest zone containing it, 0 for no zone
+        self.labels = np.zeros((max(height, 1), max(width, 1)), dtype=np.uint8 if len(zones) < 256 else np.uint16)
+        #Paint the largest zones first so smaller overlapping zones end up on top; with equal areas the first zone wins
+        for i in sorted(range(len(zones)), key=lambda i: (zone_area(zones[i]), i), reverse=True):
+            paint_zone(self.labels, zones[i], i + 1)
+
+    #Method to get the 1-based id of the zone containing a point, or None
+    def lookup(self, point):
+        x, y = point
+        if 0 <= y < self.labels.shape[0] and 0 <= x < self.labels.shape[1]:
+            return int(self.labels[y, x]) or None
+        return None
+
+#Arenas are dictionaries with a name, an roi (x, y, width, height) and the arena's own zones, all in the same pixels as single animal zones
+
+#Function to convert an arena read from a config file into a dictionary with a name, an roi tuple and normalized zones
+def normalize_arena(arena, number):
+    if 'roi' not in arena:
+        raise ValueError(f"Arena {arena.get('name', number)} needs an roi")
+    roi = tuple(int(v) for v in arena['roi'])
+    if len(roi) != 4:
+        raise ValueError(f"An arena roi needs x, y, width and height, got {arena['roi']}")
+    return {'name': str(arena.get('name', number)), 'roi': roi, 'zones': [normalize_zone(zone) for zone in arena.get('zones', [])]}
+
+#Function to convert an arena into a value that can be saved to a JSON or YAML config file
+def arena_to_config(arena):
+    return {'name': arena['name'], 'roi': list(arena['roi']), 'zones': [zone_to_config(zone) for zone in arena['zones']]}
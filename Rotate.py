@@ -4,6 +4,14 @@ from PIL import Image, ImageTk
 import cv2
 import numpy as np
 import os
+import sys
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from PawsitionPipeline import StageTimer, BatchWriter, prefetch
+
+# Seconds between progress updates in the GUI
+PROGRESS_PERIOD = 0.5
 
 def select_video():
     root = tk.Tk()
@@ -12,8 +20,7 @@ def select_video():
     root.destroy()
     return file_path
 
-def rotate_image(image, angle):
-    h, w = image.shape[:2]
+def rotation_matrix(w, h, angle):
     center = (w / 2, h / 2)
 
     M = cv2.getRotationMatrix2D(center, angle, 1)
@@ -25,39 +32,128 @@ def rotate_image(image, angle):
 
     M[0, 2] += bound_w/2 - center[0]
     M[1, 2] += bound_h/2 - center[1]
+    return M, (bound_w, bound_h)
+
+def rotate_image(image, angle):
+    h, w = image.shape[:2]
+    M, (bound_w, bound_h) = rotation_matrix(w, h, angle)
 
     rotated = cv2.warpAffine(image, M, (bound_w, bound_h), borderMode=cv2.BORDER_CONSTANT, borderValue=(0, 0, 0))
     return rotated
 
-def process_video(video_path, angle, progress_label):
+def rotated_path(video_path):
     file_dir, file_name = os.path.split(video_path)
     name, ext = os.path.splitext(file_name)
-    output_file = os.path.join(file_dir, f"{name}_rotated{ext}")
+    return os.path.join(file_dir, f"{name}_rotated{ext}")
+
+def read_video_frames(cap):
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            return
+        yield frame
+
+def process_video(video_path, angle, progress_label=None, progress=None, queue_size=16, stage_times=None, progress_period=PROGRESS_PERIOD):
+    output_file = rotated_path(video_path)
 
     cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise IOError(f"Could not open video file: {video_path}")
     fourcc = cv2.VideoWriter_fourcc(*'XVID')
     fps = cap.get(cv2.CAP_PROP_FPS)
     frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    ret, frame = cap.read()
-    rotated_frame = rotate_image(frame, angle)
-    h, w = rotated_frame.shape[:2]
-    out = cv2.VideoWriter(output_file, fourcc, fps, (w, h))
-
-    cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-    for i in range(frame_count):
-        ret, frame = cap.read()
-        if ret:
-            rotated_frame = rotate_image(frame, angle)
-            out.write(rotated_frame)
-            progress = (i + 1) / frame_count * 100
-            progress_label.config(text=f"Processing: {progress:.2f}%")
-            progress_label.update()
-        else:
-            break
-
-    cap.release()
-    out.release()
-    progress_label.config(text="Processing Complete!")
+    w = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    # The warp is the same for every frame, so compute it once
+    M, (bound_w, bound_h) = rotation_matrix(w, h, angle)
+    out = cv2.VideoWriter(output_file, fourcc, fps, (bound_w, bound_h))
+
+    # Decoding and encoding run in their own threads; warped frames go into a ring of reused buffers
+    # big enough for every frame that can be waiting in the encoder queue
+    timer = stage_times if stage_times is not None else StageTimer()
+    buffers = [np.empty((bound_h, bound_w, 3), dtype=np.uint8) for _ in range(queue_size + 3)]
+    frames = prefetch(read_video_frames(cap), queue_size, timer, 'decode')
+    writer = BatchWriter(lambda batch: [out.write(frame) for frame in batch], timer, batch_size=1, threaded=True, maxsize=queue_size)
+    last_report = 0
+    i = 0
+    try:
+        for i, frame in enumerate(frames, 1):
+            start = time.perf_counter()
+            rotated_frame = cv2.warpAffine(frame, M, (bound_w, bound_h), dst=buffers[i % len(buffers)], borderMode=cv2.BORDER_CONSTANT, borderValue=(0, 0, 0))
+            timer.add('warp', time.perf_counter() - start)
+            writer.write(rotated_frame)
+            # Only redraw the progress a few times per second
+            now = time.perf_counter()
+            if now - last_report >= progress_period:
+                last_report = now
+                report_progress(i, frame_count, progress_label, progress)
+    finally:
+        frames.close()
+        writer.close()
+        cap.release()
+        out.release()
+    report_progress(i, frame_count, progress_label, progress)
+    if progress_label is not None:
+        progress_label.config(text="Processing Complete!")
+    return output_file, i
+
+def report_progress(done, frame_count, progress_label, progress):
+    percent = done / frame_count * 100 if frame_count else 0
+    if progress_label is not None:
+        progress_label.config(text=f"Processing: {percent:.2f}%")
+        progress_label.update()
+    if progress is not None:
+        progress(done, frame_count)
+
+def rotate_videos(jobs, workers=1, queue_size=16):
+    results = {}
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(rotate_one, video_path, angle, queue_size): video_path for video_path, angle in jobs}
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+        return results
+    for video_path, angle in jobs:
+        results[video_path] = rotate_one(video_path, angle, queue_size)
+    return results
+
+def rotate_one(video_path, angle, queue_size=16):
+    start = time.perf_counter()
+    print(f"Rotating {video_path} by {angle} degrees")
+    try:
+        output_file, frames = process_video(video_path, angle, progress=lambda done, total: print(f"  {os.path.basename(video_path)}: {done}/{total} frames"), queue_size=queue_size, progress_period=5.0)
+    except Exception as e:
+        print(f"Failed to rotate {video_path}: {e}")
+        return e
+    elapsed = time.perf_counter() - start
+    print(f"Saved {output_file} ({frames} frames, {frames / elapsed if elapsed else 0:.1f} frames/sec)")
+    return output_file
+
+def parse_job(job, default_angle):
+    # VIDEO:ANGLE, split on the last colon so Windows drive letters still work
+    path, sep, angle = job.rpartition(':')
+    if sep:
+        try:
+            return path, float(angle)
+        except ValueError:
+            pass
+    if default_angle is None:
+        raise ValueError(f"No angle given for {job}; use VIDEO:ANGLE or --angle")
+    return job, default_angle
+
+def batch_main(argv):
+    parser = argparse.ArgumentParser(description="Rotate videos without the GUI. Each output is saved next to its video as NAME_rotated.EXT.")
+    parser.add_argument('videos', nargs='+', help="Videos as VIDEO:ANGLE, or plain paths rotated by --angle.")
+    parser.add_argument('-a', '--angle', type=float, default=None, help="Angle for videos given without one.")
+    parser.add_argument('-w', '--workers', type=int, default=1, help="Number of videos rotated at the same time (default: 1).")
+    parser.add_argument('--queue-size', type=int, default=16, help="Frames buffered between the decode, warp and encode threads (default: 16).")
+    args = parser.parse_intermixed_args(argv)
+    try:
+        jobs = [parse_job(job, args.angle) for job in args.videos]
+    except ValueError as e:
+        parser.error(str(e))
+    results = rotate_videos(jobs, args.workers, args.queue_size)
+    return 1 if any(isinstance(result, Exception) for result in results.values()) else 0
 
 def main():
     root = tk.Tk()
@@ -117,4 +213,6 @@ def main():
     root.destroy()
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        sys.exit(batch_main(sys.argv[1:]))
     main()
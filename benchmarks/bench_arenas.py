@@ -0,0 +1,53 @@
+#Benchmark of tracking several arenas filmed in one frame, in one pass against one cropped run per arena
+#Usage: python benchmarks/bench_arenas.py [--columns 4 --rows 2 --frames 900]
+import argparse
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from PawsitionPatrol import PawsitionPatrol
+from synthetic import make_multi_arena_video, arena_zones
+
+#Function to track a video with the given settings, returning the seconds taken
+def track(video_path, output_dir, settings):
+    pawsition_patrol = PawsitionPatrol(output_dir)
+    pawsition_patrol.sensitivity = 100
+    pawsition_patrol.verbose = False
+    for name, value in settings.items():
+        setattr(pawsition_patrol, name, value)
+    pawsition_patrol.open_video(video_path)
+    start = time.perf_counter()
+    pawsition_patrol.track()
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare tracking several arenas in one pass with one cropped run per arena.")
+    parser.add_argument('--columns', type=int, default=2)
+    parser.add_argument('--rows', type=int, default=2)
+    parser.add_argument('--arena-width', type=int, default=320)
+    parser.add_argument('--arena-height', type=int, default=240)
+    parser.add_argument('--frames', type=int, default=900)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as work_dir:
+        video_path = os.path.join(work_dir, 'rig.avi')
+        rois, trajectories = make_multi_arena_video(video_path, args.columns, args.rows, args.arena_width, args.arena_height, args.frames)
+        #Each arena has the benchmark's two zones, moved to its own corner of the frame
+        arenas = [{'name': f"A{i + 1}", 'roi': roi, 'zones': [(x + roi[0], y + roi[1], w, h) for x, y, w, h in arena_zones(*roi[2:])]} for i, roi in enumerate(rois)]
+        separate_seconds = sum(track(video_path, os.path.join(work_dir, 'separate', arena['name']), {'roi': arena['roi'], 'zones': arena['zones']}) for arena in arenas)
+        single_seconds = track(video_path, os.path.join(work_dir, 'single'), {'arenas': arenas})
+        print(f"{len(arenas)} arenas, {args.frames} frames of {args.columns * args.arena_width}x{args.rows * args.arena_height}")
+        print(f"{'One run per arena':<20}{separate_seconds:>8.2f} s{len(arenas) * args.frames / separate_seconds:>10.1f} arena frames/sec")
+        print(f"{'One pass':<20}{single_seconds:>8.2f} s{len(arenas) * args.frames / single_seconds:>10.1f} arena frames/sec ({separate_seconds / single_seconds:.1f}x)")
+        for arena, trajectory in zip(arenas, trajectories):
+            separate = pd.read_csv(os.path.join(work_dir, 'separate', arena['name'], 'rig', 'rig_positions.csv'))
+            single = pd.read_csv(os.path.join(work_dir, 'single', 'rig_' + arena['name'], 'rig_' + arena['name'] + '_positions.csv'))
+            positions = single[['Position X', 'Position Y']].to_numpy()
+            detected = ~np.isnan(positions[:, 0])
+            error = np.hypot(*(positions[detected] - trajectory[:len(positions)][detected]).T).mean()
+            print(f"{arena['name']}: same rows as its own run: {single.equals(separate)}, detected {detected.mean():.1%}, error {error:.2f} px")
+
+if __name__ == "__main__":
+    main()
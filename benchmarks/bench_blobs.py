@@ -0,0 +1,71 @@
+#Micro-benchmark of the contour and connected-components blob stages on recorded foreground masks
+#Usage: python benchmarks/bench_blobs.py [--frames 600 --noise 40] [--min-agreement 1.0]
+#Exits with status 1 when a stage selects a different blob than the contour path on more than the allowed share of masks
+import argparse
+import os
+import sys
+import tempfile
+import time
+import cv2
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from PawsitionPatrol import PawsitionPatrol
+from synthetic import make_arena_video
+
+#Function to record the foreground masks of a video so every blob stage sees the same input
+def record_masks(video_path):
+    pawsition_patrol = PawsitionPatrol(None)
+    pawsition_patrol.open_video(video_path, create_output=False)
+    masks = [pawsition_patrol.background_model().apply(frame) for _, frame in pawsition_patrol.read_frames(0)]
+    pawsition_patrol.cap.release()
+    return masks
+
+#Function to run a blob stage over recorded masks, returning the centers and the time per mask
+def run_stage(masks, blob_method, morph_kernel, sensitivity):
+    pawsition_patrol = PawsitionPatrol(None)
+    pawsition_patrol.sensitivity = sensitivity
+    pawsition_patrol.blob_method = blob_method
+    pawsition_patrol.morph_kernel = morph_kernel
+    centers = []
+    start = time.perf_counter()
+    for fgmask in masks:
+        bbox = pawsition_patrol.find_largest_blob(pawsition_patrol.threshold_mask(fgmask))
+        centers.append(None if bbox is None else (int(bbox[0] + bbox[2]/2), int(bbox[1] + bbox[3]/2)))
+    return centers, (time.perf_counter() - start) / len(masks)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare blob selection stages on recorded masks.")
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--frames', type=int, default=600)
+    parser.add_argument('--noise', type=int, default=40, help="Sensor noise level; higher values give more speckle contours.")
+    parser.add_argument('--sensitivity', type=int, default=500)
+    parser.add_argument('--min-agreement', type=float, default=1.0, help="Smallest share of masks where a stage must find the same center as the contour path (default: 1.0).")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as work_dir:
+        video_path = os.path.join(work_dir, 'arena.avi')
+        make_arena_video(video_path, args.width, args.height, args.frames, noise=args.noise)
+        masks = record_masks(video_path)
+    thresholds = [cv2.threshold(fgmask, 200, 255, cv2.THRESH_BINARY)[1] for fgmask in masks]
+    speckles = sum(len(cv2.findContours(t, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)[0]) for t in thresholds) / len(thresholds)
+    print(f"{len(masks)} masks of {args.width}x{args.height}, {speckles:.0f} contours per mask on average")
+    print(f"{'Stage':<28}{'ms/mask':>9}{'speedup':>9}{'same centers as contours':>26}")
+    baseline_time = None
+    failed = []
+    for morph_kernel in (0, 3):
+        reference = None
+        for blob_method in ('contours', 'components'):
+            centers, per_mask = run_stage(masks, blob_method, morph_kernel, args.sensitivity)
+            reference = reference or centers
+            baseline_time = baseline_time or per_mask
+            identical = sum(a == b for a, b in zip(centers, reference)) / len(reference)
+            label = f"{blob_method}" + (f" + opening {morph_kernel}" if morph_kernel else "")
+            print(f"{label:<28}{1000 * per_mask:>9.3f}{baseline_time / per_mask:>8.2f}x{identical:>25.1%}")
+            if identical < args.min_agreement:
+                failed.append(label)
+    if failed:
+        print(f"Centers differ from the contour path on more than {1 - args.min_agreement:.1%} of masks: {', '.join(failed)}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
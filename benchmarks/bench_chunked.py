@@ -0,0 +1,51 @@
+#Benchmark of chunked intra-video tracking against the serial tracker
+#Usage: python benchmarks/bench_chunked.py [--frames 9000] [--chunks 2 4 8]
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import pandas as pd
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from PawsitionBatch import track_video, track_video_chunked
+from synthetic import make_arena_video
+
+#Function to compare two position tracks row by row
+def agreement(serial, chunked):
+    same_zone = (serial['Zone'].fillna(0) == chunked['Zone'].fillna(0)).mean()
+    error = ((serial['Position X'] - chunked['Position X']) ** 2 + (serial['Position Y'] - chunked['Position Y']) ** 2) ** 0.5
+    return {'rows': [len(serial), len(chunked)], 'zone_agreement': float(same_zone), 'max_position_error': float(error.max()), 'mean_position_error': float(error.mean())}
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare chunked and serial tracking speed and output.")
+    parser.add_argument('--frames', type=int, default=9000)
+    parser.add_argument('--width', type=int, default=640)
+    parser.add_argument('--height', type=int, default=480)
+    parser.add_argument('--chunks', type=int, nargs='+', default=[2, 4, 8])
+    parser.add_argument('--warmup-frames', type=int, default=500)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as work_dir:
+        video_path = os.path.join(work_dir, 'arena.avi')
+        make_arena_video(video_path, args.width, args.height, args.frames)
+        config_path = os.path.join(work_dir, 'zones.json')
+        w, h = args.width, args.height
+        with open(config_path, 'w') as f:
+            json.dump({'zones': [[0, 0, w // 2, h], [w // 2, 0, w - w // 2, h], [w // 4, h // 4, w // 2, h // 2]], 'sensitivity': 100}, f)
+
+        start = time.perf_counter()
+        track_video(video_path, config_path, os.path.join(work_dir, 'serial'))
+        serial_time = time.perf_counter() - start
+        serial = pd.read_csv(os.path.join(work_dir, 'serial', 'arena', 'arena_positions.csv'))
+        print(f"serial: {serial_time:.2f} s ({args.frames / serial_time:.0f} frames/sec)")
+
+        for chunks in args.chunks:
+            output_dir = os.path.join(work_dir, f'chunks{chunks}')
+            start = time.perf_counter()
+            track_video_chunked(video_path, config_path, output_dir, chunks, args.warmup_frames)
+            elapsed = time.perf_counter() - start
+            chunked = pd.read_csv(os.path.join(output_dir, 'arena', 'arena_positions.csv'))
+            print(f"{chunks} chunks: {elapsed:.2f} s ({args.frames / elapsed:.0f} frames/sec, {serial_time / elapsed:.2f}x) {agreement(serial, chunked)}")
+
+if __name__ == "__main__":
+    main()
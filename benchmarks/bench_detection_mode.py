@@ -0,0 +1,63 @@
+#Benchmark of the cropped/grayscale/downscaled detection modes against full-resolution detection
+#Usage: python benchmarks/bench_detection_mode.py [--width 1920 --height 1080 --frames 900]
+import argparse
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from PawsitionPatrol import PawsitionPatrol
+from synthetic import make_arena_video
+
+#Detection modes compared, as PawsitionPatrol settings
+MODES = {
+    'full resolution': {},
+    'crop to zones': {'crop_to_zones': True},
+    'crop + gray': {'crop_to_zones': True, 'grayscale': True},
+    'crop + gray + 1/2': {'crop_to_zones': True, 'grayscale': True, 'detection_scale': 0.5},
+    'crop + gray + 1/4': {'crop_to_zones': True, 'grayscale': True, 'detection_scale': 0.25},
+}
+
+#Function to detect the hamster in every frame of a video with the given settings
+def detect_all(video_path, zones, settings):
+    pawsition_patrol = PawsitionPatrol(None)
+    pawsition_patrol.zones = zones
+    pawsition_patrol.sensitivity = 100
+    for name, value in settings.items():
+        setattr(pawsition_patrol, name, value)
+    pawsition_patrol.open_video(video_path, create_output=False)
+    start = time.perf_counter()
+    detections = list(pawsition_patrol.detect_frames(0))
+    elapsed = time.perf_counter() - start
+    pawsition_patrol.cap.release()
+    centers = np.array([center if center else (np.nan, np.nan) for _, center, _ in detections], dtype=float)
+    zone_ids = np.array([zone or 0 for _, _, zone in detections])
+    return centers, zone_ids, elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare detection modes for accuracy and throughput.")
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--frames', type=int, default=900)
+    args = parser.parse_args()
+    w, h = args.width, args.height
+    #The maze occupies the middle of the frame, the rest is bench and walls
+    zones = [(w // 16, h // 16, 7 * w // 16, 7 * h // 8), (w // 2, h // 16, 7 * w // 16, 7 * h // 8)]
+    with tempfile.TemporaryDirectory() as work_dir:
+        video_path = os.path.join(work_dir, 'arena.avi')
+        truth = make_arena_video(video_path, w, h, args.frames, radius=w // 40).astype(float)
+        reference = None
+        print(f"{'Mode':<20}{'frames/sec':>11}{'speedup':>9}{'err vs truth':>14}{'err vs full':>13}{'zone agree':>12}")
+        for mode, settings in MODES.items():
+            centers, zone_ids, elapsed = detect_all(video_path, zones, settings)
+            if reference is None:
+                reference = (centers, zone_ids, elapsed)
+            detected = ~np.isnan(centers[:, 0])
+            truth_error = np.nanmean(np.hypot(*(centers[detected] - truth[detected]).T))
+            full_error = np.nanmean(np.hypot(*(centers - reference[0]).T))
+            zone_agreement = (zone_ids == reference[1]).mean()
+            print(f"{mode:<20}{args.frames / elapsed:>11.1f}{reference[2] / elapsed:>8.2f}x{truth_error:>13.2f}px{full_error:>11.2f}px{zone_agreement:>11.1%}")
+
+if __name__ == "__main__":
+    main()
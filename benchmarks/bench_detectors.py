@@ -0,0 +1,71 @@
+#Benchmark of the background model backends for speed and positional agreement
+#Usage: python benchmarks/bench_detectors.py [--video reference.mp4 --config zones.json] [--width 1280 --height 720 --frames 900]
+import argparse
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from PawsitionPatrol import PawsitionPatrol
+from synthetic import make_arena_video
+
+#Detectors compared, as PawsitionPatrol settings; mog2 without shadows shows what shadow detection costs
+BACKENDS = {
+    'mog2': {'detector': 'mog2'},
+    'mog2 no shadows': {'detector': 'mog2', 'detect_shadows': False},
+    'knn': {'detector': 'knn'},
+    'median': {'detector': 'median'},
+    'diff': {'detector': 'diff'},
+}
+
+#Function to detect the hamster in every frame of a video with the given settings
+def detect_all(video_path, config_path, zones, settings):
+    pawsition_patrol = PawsitionPatrol(None)
+    if config_path:
+        pawsition_patrol.load_config(config_path)
+    else:
+        pawsition_patrol.zones = zones
+        pawsition_patrol.sensitivity = 100
+    for name, value in settings.items():
+        setattr(pawsition_patrol, name, value)
+    pawsition_patrol.open_video(video_path, create_output=False)
+    start = time.perf_counter()
+    detections = list(pawsition_patrol.detect_frames(0))
+    elapsed = time.perf_counter() - start
+    pawsition_patrol.cap.release()
+    centers = np.array([center if center else (np.nan, np.nan) for _, center, _ in detections], dtype=float)
+    zone_ids = np.array([zone or 0 for _, _, zone in detections])
+    return centers, zone_ids, elapsed, pawsition_patrol.fgbg.cost()
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare background model backends for speed and positional agreement.")
+    parser.add_argument('--video', help="Reference clip to compare on (default: a synthetic arena video with known positions).")
+    parser.add_argument('--config', help="Zones and settings for --video.")
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--frames', type=int, default=900)
+    args = parser.parse_args()
+    w, h = args.width, args.height
+    zones = [(w // 16, h // 16, 7 * w // 16, 7 * h // 8), (w // 2, h // 16, 7 * w // 16, 7 * h // 8)]
+    with tempfile.TemporaryDirectory() as work_dir:
+        video_path, truth = args.video, None
+        if video_path is None:
+            video_path = os.path.join(work_dir, 'arena.avi')
+            truth = make_arena_video(video_path, w, h, args.frames, radius=w // 40).astype(float)
+        reference = None
+        #Agreement is measured against mog2, the original detector, and against the known positions of a synthetic video
+        print(f"{'Backend':<18}{'ms/frame':>9}{'frames/sec':>11}{'detected':>10}{'err vs truth':>14}{'err vs mog2':>13}{'zone agree':>12}")
+        for backend, settings in BACKENDS.items():
+            centers, zone_ids, elapsed, cost = detect_all(video_path, args.config, zones, settings)
+            if reference is None:
+                reference = (centers, zone_ids)
+            detected = ~np.isnan(centers[:, 0])
+            truth_error = np.nanmean(np.hypot(*(centers[detected] - truth[:len(centers)][detected]).T)) if truth is not None else np.nan
+            both = detected & ~np.isnan(reference[0][:, 0])
+            reference_error = np.mean(np.hypot(*(centers[both] - reference[0][both]).T)) if both.any() else np.nan
+            zone_agreement = (zone_ids == reference[1]).mean()
+            print(f"{backend:<18}{cost:>9.3f}{len(centers) / elapsed:>11.1f}{detected.mean():>10.1%}{truth_error:>12.2f}px{reference_error:>11.2f}px{zone_agreement:>11.1%}")
+
+if __name__ == "__main__":
+    main()
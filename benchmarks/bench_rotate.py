@@ -0,0 +1,73 @@
+#Benchmark of the pipelined Rotate.process_video against the original per-frame loop, in frames/sec
+#Usage: python benchmarks/bench_rotate.py [--width 1280 --height 720 --frames 600 --angle 7]
+import argparse
+import os
+import sys
+import tempfile
+import time
+import cv2
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from PawsitionPipeline import StageTimer
+from Rotate import process_video, rotate_image, rotated_path
+from synthetic import make_arena_video
+
+#Class standing in for the Tk progress label; the original loop also paid for a Tk redraw every frame, which is not counted here
+class NullLabel:
+    def config(self, **kwargs):
+        pass
+
+    def update(self):
+        pass
+
+#Function with the original process_video loop: warp recomputed every frame, decode, warp and encode in series
+def original_process_video(video_path, angle, progress_label):
+    output_file = rotated_path(video_path)
+    cap = cv2.VideoCapture(video_path)
+    fourcc = cv2.VideoWriter_fourcc(*'XVID')
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    ret, frame = cap.read()
+    rotated_frame = rotate_image(frame, angle)
+    h, w = rotated_frame.shape[:2]
+    out = cv2.VideoWriter(output_file, fourcc, fps, (w, h))
+    cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+    for i in range(frame_count):
+        ret, frame = cap.read()
+        if ret:
+            rotated_frame = rotate_image(frame, angle)
+            out.write(rotated_frame)
+            progress = (i + 1) / frame_count * 100
+            progress_label.config(text=f"Processing: {progress:.2f}%")
+            progress_label.update()
+        else:
+            break
+    cap.release()
+    out.release()
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare rotation throughput.")
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--frames', type=int, default=600)
+    parser.add_argument('--angle', type=float, default=7)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as work_dir:
+        video_path = os.path.join(work_dir, 'arena.avi')
+        make_arena_video(video_path, args.width, args.height, args.frames)
+
+        start = time.perf_counter()
+        original_process_video(video_path, args.angle, NullLabel())
+        original = time.perf_counter() - start
+
+        stage_times = StageTimer()
+        start = time.perf_counter()
+        process_video(video_path, args.angle, stage_times=stage_times)
+        pipelined = time.perf_counter() - start
+
+        print(f"{args.frames} frames of {args.width}x{args.height}, rotated by {args.angle} degrees")
+        print(f"original loop:   {args.frames / original:8.1f} frames/sec")
+        print(f"pipelined:       {args.frames / pipelined:8.1f} frames/sec ({original / pipelined:.2f}x)")
+        print(stage_times.report())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+#Check that --stream writes the same output files as the in-memory analysis at any chunk size, and time both
+#Usage: python benchmarks/bench_stream.py [--rows 200000] [--chunk-rows 37 1000 100000]
+#Exits with status 1 when a streamed file differs from the in-memory one
+import argparse
+import csv
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from PawsitionPatrolData import PawsitionPatrol
+
+OUTPUT_SUFFIXES = ('_Zone_Latency.csv', '_Zone_Times.csv', '_Distance_Traveled.csv')
+
+#Function to write a _positions.csv as the tracker does: empty rows before the first detection and wherever the animal was missed
+def make_positions(path, rows, fps=30, gaps=True, seed=0):
+    rng = np.random.default_rng(seed)
+    xy = np.clip(np.cumsum(rng.normal(0, 2, (rows, 2)), axis=0) + 300, 0, 600).astype(int)
+    #A few misdetections far from the animal become outlier steps
+    jumps = rng.random(rows) < 0.002
+    xy[jumps] = rng.integers(0, 600, (int(jumps.sum()), 2))
+    zones = 1 + (xy[:, 0] > 300) + 2 * (xy[:, 1] > 300)
+    missing = (np.arange(rows) < fps) | (rng.random(rows) < 0.03) if gaps else np.zeros(rows, dtype=bool)
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["Time", "Position X", "Position Y", "Zone"])
+        for i in range(rows):
+            writer.writerow([i / fps, None, None, None] if missing[i] else [i / fps, xy[i, 0], xy[i, 1], zones[i]])
+
+#Function to read the output files of a session
+def read_outputs(session):
+    outputs = {}
+    for suffix in OUTPUT_SUFFIXES:
+        with open(session.output_path(suffix), 'rb') as f:
+            outputs[suffix] = f.read()
+    return outputs
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare streamed and in-memory analysis output files.")
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--chunk-rows', type=int, nargs='+', default=[37, 1000, 100000])
+    args = parser.parse_args()
+    failed = False
+    with tempfile.TemporaryDirectory() as work_dir:
+        for gaps in (True, False):
+            path = os.path.join(work_dir, 'KM1_positions.csv')
+            make_positions(path, args.rows, gaps=gaps)
+            session = PawsitionPatrol(path)
+            start = time.perf_counter()
+            session.run(plot=False)
+            print(f"{'With gaps' if gaps else 'Without gaps'}: in memory {time.perf_counter() - start:.2f} s")
+            reference = read_outputs(session)
+            for chunk_rows in args.chunk_rows:
+                start = time.perf_counter()
+                PawsitionPatrol(path).run_streaming(chunk_rows)
+                seconds = time.perf_counter() - start
+                different = [suffix for suffix, data in read_outputs(session).items() if data != reference[suffix]]
+                failed = failed or bool(different)
+                print(f"  --stream --chunk-rows {chunk_rows:<8}{seconds:>7.2f} s  {'differs: ' + ', '.join(different) if different else 'identical'}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,79 @@
+#Benchmark of the binary track format against _positions.csv for write size, write time and load time
+#Usage: python benchmarks/bench_track_format.py [--hours 2 --fps 30]
+import argparse
+import csv
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from PawsitionTrack import TrackWriter, load_track, open_track
+
+#Function to make tracker rows for a random walk, with gaps where the animal was not detected
+def make_rows(frames, fps, seed=0):
+    rng = np.random.default_rng(seed)
+    xy = np.clip(np.cumsum(rng.normal(0, 2, (frames, 2)), axis=0) + 500, 0, 1000).astype(int)
+    zones = 1 + (xy[:, 0] > 500) + 2 * (xy[:, 1] > 500)
+    missing = rng.random(frames) < 0.05
+    rows = []
+    for i in range(frames):
+        if missing[i]:
+            rows.append([i / fps, None, None, None])
+        else:
+            rows.append([i / fps, int(xy[i, 0]), int(xy[i, 1]), int(zones[i])])
+    return rows
+
+#Function to get the size of a file or of every file in a directory
+def disk_size(path):
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+    return os.path.getsize(path)
+
+#Function to time a function call
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the binary track format with CSV.")
+    parser.add_argument('--hours', type=float, default=2)
+    parser.add_argument('--fps', type=float, default=30)
+    parser.add_argument('--batch-size', type=int, default=256)
+    args = parser.parse_args()
+    frames = int(args.hours * 3600 * args.fps)
+    rows = make_rows(frames, args.fps)
+    with tempfile.TemporaryDirectory() as work_dir:
+        csv_path = os.path.join(work_dir, 'session_positions.csv')
+        track_path = os.path.join(work_dir, 'session_positions.track')
+
+        def write_csv():
+            with open(csv_path, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(["Time", "Position X", "Position Y", "Zone"])
+                for start in range(0, frames, args.batch_size):
+                    writer.writerows(rows[start:start + args.batch_size])
+
+        def write_track():
+            writer = TrackWriter(track_path, {'fps': args.fps})
+            for start in range(0, frames, args.batch_size):
+                writer.writerows(rows[start:start + args.batch_size])
+            writer.close()
+
+        _, csv_write = timed(write_csv)
+        _, track_write = timed(write_track)
+        csv_data, csv_load = timed(pd.read_csv, csv_path)
+        track_data, track_load = timed(load_track, track_path)
+        _, track_map = timed(open_track, track_path)
+        same = np.allclose(csv_data.fillna(-1).values, track_data.fillna(-1).values)
+
+        print(f"{frames} rows ({args.hours} h at {args.fps} fps), identical after load: {same}")
+        print(f"{'Format':<24}{'Size (MB)':>10}{'Write (s)':>11}{'Load (s)':>10}")
+        print(f"{'CSV':<24}{disk_size(csv_path) / 1e6:>10.1f}{csv_write:>11.2f}{csv_load:>10.3f}")
+        print(f"{'Track (DataFrame)':<24}{disk_size(track_path) / 1e6:>10.1f}{track_write:>11.2f}{track_load:>10.3f}")
+        print(f"{'Track (memory-mapped)':<24}{'':>10}{'':>11}{track_map:>10.4f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+#Offline benchmark suite: tracks synthetic arena videos with known positions and zones at several resolutions and lengths,
+#times the analysis of large position files, and saves everything as JSON so versions can be compared
+#Usage: python benchmarks/suite.py [--quick] [--output results.json] [--compare old.json]
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+try:
+    import resource
+except ImportError:
+    resource = None
+import cv2
+import numpy as np
+import pandas as pd
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+from PawsitionPatrol import PawsitionPatrol
+from PawsitionPatrolData import PawsitionPatrol as PawsitionPatrolData
+from PawsitionTrack import TrackWriter
+from synthetic import make_arena_video, arena_zones, trajectory_zones
+
+SUITE_VERSION = 1
+RESOLUTIONS = {'480p': (640, 480), '720p': (1280, 720), '1080p': (1920, 1080)}
+LENGTHS = (300, 1800)
+ANALYSIS_ROWS = 2000000
+FPS = 30
+#Metrics where a larger value is better, for --compare
+HIGHER_IS_BETTER = ('fps', 'detected', 'zone_agreement')
+
+#Function to get the peak resident memory of this process in MB, or None where it cannot be measured
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    #Linux reports kilobytes, macOS bytes
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+#Function to describe the code and machine the results were measured on
+def environment():
+    try:
+        commit = subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=REPO_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = 'unknown'
+    return {'commit': commit, 'python': platform.python_version(), 'opencv': cv2.__version__, 'numpy': np.__version__, 'pandas': pd.__version__,
+            'platform': platform.platform(), 'processor': platform.processor(), 'cpu_count': os.cpu_count()}
+
+#Function to track a video in a fresh process, returning the throughput and peak memory
+def track_case(video_path, output_dir, zones):
+    base_rss = peak_rss_mb()
+    pawsition_patrol = PawsitionPatrol(output_dir)
+    pawsition_patrol.zones = zones
+    pawsition_patrol.sensitivity = 100
+    pawsition_patrol.verbose = False
+    pawsition_patrol.open_video(video_path)
+    start = time.perf_counter()
+    frames = pawsition_patrol.track()
+    seconds = time.perf_counter() - start
+    return {'frames': frames, 'seconds': seconds, 'fps': frames / seconds, 'peak_rss_mb': peak_rss_mb(), 'base_rss_mb': base_rss,
+            'positions': os.path.join(output_dir, pawsition_patrol.base_file_name, pawsition_patrol.base_file_name + '_positions.csv')}
+
+#Function to score tracked positions against the ground truth trajectory and zones
+def score_case(positions_path, truth, truth_zones):
+    data = pd.read_csv(positions_path)
+    frames = np.rint(data['Time'].to_numpy() * FPS).astype(int)
+    positions = data[['Position X', 'Position Y']].to_numpy()
+    detected = ~np.isnan(positions[:, 0])
+    error = np.hypot(*(positions[detected] - truth[frames[detected]]).T)
+    zones = data['Zone'].fillna(0).to_numpy()
+    #Occupancy is compared as seconds per zone, computed by the analysis from the tracked rows and from the true zone of every frame
+    tracked_seconds = PawsitionPatrolData(positions_path).seconds_per_zone
+    true_seconds = pd.Series(1 / FPS, index=truth_zones[:-1]).groupby(level=0).sum().drop(0, errors='ignore')
+    occupancy_error = tracked_seconds.sub(true_seconds, fill_value=0).abs().sum() / true_seconds.sum()
+    return {'detected': float(detected.mean()), 'mean_error_px': float(error.mean()), 'p95_error_px': float(np.percentile(error, 95)),
+            'zone_agreement': float((zones == truth_zones[frames]).mean()), 'occupancy_error': float(occupancy_error)}
+
+#Function to write a synthetic position file with the given number of rows, as a CSV or a track
+def make_positions(path, rows, seed=0):
+    rng = np.random.default_rng(seed)
+    x = np.clip(320 + np.cumsum(rng.normal(0, 2, rows)), 0, 639)
+    y = np.clip(240 + np.cumsum(rng.normal(0, 2, rows)), 0, 479)
+    data = pd.DataFrame({'Time': np.arange(rows) / FPS, 'Position X': x.round(), 'Position Y': y.round(), 'Zone': np.where(x < 320, 1.0, 2.0)})
+    if path.endswith('.csv'):
+        data.to_csv(path, index=False)
+    else:
+        writer = TrackWriter(path, {'fps': FPS})
+        writer.writerows(data.to_numpy())
+        writer.close()
+
+#Function to time one analysis of a position file in a fresh process
+def analysis_case(path, mode):
+    base_rss = peak_rss_mb()
+    #The memory and stream modes write the same _Zone_Latency, _Zone_Times and _Distance_Traveled files, compute only loads and analyzes,
+    #and metrics times the _Metrics.csv table of an already analyzed session
+    session = PawsitionPatrolData(path)
+    if mode == 'metrics':
+        session.results
+    start = time.perf_counter()
+    if mode == 'metrics':
+        session.metrics
+    elif mode == 'stream':
+        session.run_streaming()
+    elif mode == 'memory':
+        session.run(plot=False)
+    else:
+        session.results
+    return {'seconds': time.perf_counter() - start, 'peak_rss_mb': peak_rss_mb(), 'base_rss_mb': base_rss}
+
+#Function to run a function in a new process, so its peak memory is its own
+def run_isolated(function, *args):
+    with multiprocessing.get_context('spawn').Pool(1) as pool:
+        return pool.apply(function, args)
+
+#Function to run every tracking and analysis case and collect the results
+def run_suite(quick=False, analysis_rows=ANALYSIS_ROWS):
+    resolutions = ['480p', '720p'] if quick else list(RESOLUTIONS)
+    lengths = LENGTHS[:1] if quick else LENGTHS
+    results = {'suite_version': SUITE_VERSION, 'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'environment': environment(), 'tracking': [], 'analysis': []}
+    with tempfile.TemporaryDirectory() as work_dir:
+        for resolution in resolutions:
+            width, height = RESOLUTIONS[resolution]
+            zones = arena_zones(width, height)
+            for frames in lengths:
+                name = f"{resolution}-{frames}"
+                video_path = os.path.join(work_dir, name + '.avi')
+                truth = make_arena_video(video_path, width, height, frames, FPS).astype(float)
+                case = {'name': name, 'width': width, 'height': height, **run_isolated(track_case, video_path, work_dir, zones)}
+                case.update(score_case(case.pop('positions'), truth, trajectory_zones(truth, zones)))
+                results['tracking'].append(case)
+                print(f"{name:<12}{case['fps']:>9.1f} fps{case['peak_rss_mb'] or 0:>9.0f} MB{case['mean_error_px']:>8.2f} px{case['zone_agreement']:>9.1%} zones{case['occupancy_error']:>8.2%} occupancy error")
+        rows = analysis_rows // 10 if quick else analysis_rows
+        for file_format in ('csv', 'track'):
+            path = os.path.join(work_dir, 'positions.' + file_format)
+            make_positions(path, rows)
+            for mode in ('compute', 'metrics', 'memory', 'stream'):
+                case = {'name': f"{file_format}-{mode}", 'rows': rows, **run_isolated(analysis_case, path, mode)}
+                case['seconds_per_million_rows'] = case['seconds'] * 1e6 / rows
+                results['analysis'].append(case)
+                print(f"{case['name']:<12}{case['seconds_per_million_rows']:>9.2f} s/M rows{case['peak_rss_mb'] or 0:>9.0f} MB")
+    return results
+
+#Function to print how every metric changed between two result files
+def compare(old, new):
+    print(f"Comparing {old['environment']['commit']} -> {new['environment']['commit']}")
+    for section in ('tracking', 'analysis'):
+        old_cases = {case['name']: case for case in old[section]}
+        for case in new[section]:
+            previous = old_cases.get(case['name'])
+            if previous is None:
+                continue
+            changes = []
+            for metric, value in case.items():
+                if metric in ('name', 'width', 'height', 'rows', 'frames', 'base_rss_mb') or not isinstance(value, (int, float)) or not previous.get(metric):
+                    continue
+                ratio = value / previous[metric]
+                better = ratio > 1 if metric in HIGHER_IS_BETTER else ratio < 1
+                changes.append(f"{metric} {ratio:.2f}x{'' if abs(ratio - 1) < 0.05 else ' (better)' if better else ' (worse)'}")
+            print(f"{section} {case['name']}: " + ", ".join(changes))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark tracking and analysis on synthetic data and save the results as JSON.")
+    parser.add_argument('--quick', action='store_true', help="Only the short 480p and 720p videos and a tenth of the analysis rows.")
+    parser.add_argument('--analysis-rows', type=int, default=ANALYSIS_ROWS, help=f"Rows in the synthetic position files (default: {ANALYSIS_ROWS}).")
+    parser.add_argument('-o', '--output', help="Results file (default: benchmarks/results/<commit>.json).")
+    parser.add_argument('--compare', metavar='OLD_JSON', help="Results of an earlier version to compare against.")
+    args = parser.parse_args()
+    results = run_suite(args.quick, args.analysis_rows)
+    output = args.output or os.path.join(REPO_DIR, 'benchmarks', 'results', results['environment']['commit'] + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {output}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
+
+if __name__ == "__main__":
+    main()
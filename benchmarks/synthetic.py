@@ -0,0 +1,65 @@
+#Import required libraries
+import cv2
+import numpy as np
+from PawsitionZones import ZoneIndex
+
+#Function to compute the ground truth path of the synthetic animal, a smooth figure-eight with pauses
+def synthetic_trajectory(width, height, frames, fps=30):
+    t = np.arange(frames) / fps
+    #Alternate between moving and resting so the tracker has to handle a stationary animal
+    phase = np.cumsum(np.where((t % 20) < 15, 1.0, 0.0)) / fps
+    margin = 0.12
+    x = width * (0.5 + (0.5 - margin) * np.sin(2 * np.pi * phase / 23))
+    y = height * (0.5 + (0.5 - margin) * np.sin(4 * np.pi * phase / 23))
+    return np.column_stack([x, y]).round().astype(int)
+
+#Function to write a synthetic arena video with a moving blob on a noisy static background
+def make_arena_video(path, width=640, height=480, frames=900, fps=30, radius=None, noise=6, seed=0):
+    rng = np.random.default_rng(seed)
+    radius = radius or max(6, width // 40)
+    #Static arena: textured floor with darker walls
+    background = rng.integers(70, 110, (height, width, 3), dtype=np.uint8)
+    cv2.rectangle(background, (0, 0), (width - 1, height - 1), (40, 40, 40), max(2, width // 100))
+    trajectory = synthetic_trajectory(width, height, frames, fps)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), fps, (width, height))
+    frame = np.empty_like(background)
+    for x, y in trajectory:
+        #Add sensor noise so background subtraction produces speckle contours like a real camera
+        np.add(background, rng.integers(0, noise, background.shape, dtype=np.uint8), out=frame)
+        cv2.circle(frame, (int(x), int(y)), radius, (235, 235, 235), -1)
+        writer.write(frame)
+    writer.release()
+    return trajectory
+
+#Function to write a video of a grid of arenas, each with its own animal on its own path, returning each arena's roi and trajectory
+def make_multi_arena_video(path, columns=2, rows=2, arena_width=320, arena_height=240, frames=900, fps=30, noise=6, seed=0):
+    rng = np.random.default_rng(seed)
+    width, height = columns * arena_width, rows * arena_height
+    radius = max(6, arena_width // 40)
+    background = rng.integers(70, 110, (height, width, 3), dtype=np.uint8)
+    rois, trajectories = [], []
+    for i in range(columns * rows):
+        x, y = (i % columns) * arena_width, (i // columns) * arena_height
+        cv2.rectangle(background, (x, y), (x + arena_width - 1, y + arena_height - 1), (40, 40, 40), max(2, arena_width // 100))
+        #Start each animal at a different point of the path so the arenas do not move in step
+        offset = i * 7 * fps
+        rois.append((x, y, arena_width, arena_height))
+        trajectories.append(synthetic_trajectory(arena_width, arena_height, frames + offset, fps)[offset:] + (x, y))
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), fps, (width, height))
+    frame = np.empty_like(background)
+    for positions in zip(*trajectories):
+        np.add(background, rng.integers(0, noise, background.shape, dtype=np.uint8), out=frame)
+        for x, y in positions:
+            cv2.circle(frame, (int(x), int(y)), radius, (235, 235, 235), -1)
+        writer.write(frame)
+    writer.release()
+    return rois, trajectories
+
+#Function to get the zones used by the benchmarks: the left and right halves of the maze in the middle of the frame
+def arena_zones(width, height):
+    return [(width // 16, height // 16, 7 * width // 16, 7 * height // 8), (width // 2, height // 16, 7 * width // 16, 7 * height // 8)]
+
+#Function to get the ground truth zone of every frame of a trajectory, 0 outside every zone
+def trajectory_zones(trajectory, zones):
+    index = ZoneIndex(zones)
+    return np.array([index.lookup((int(x), int(y))) or 0 for x, y in trajectory])